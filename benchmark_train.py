@@ -0,0 +1,333 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from manage_train import (AvailabilityCache, SeatFinder, SeatTickets,
+                          StationFees, StationIndexes, TicketIndex,
+                          find_available_seats, first_fit, get_ticket_price,
+                          get_ticket_routes, read_reserved_tickets,
+                          read_seats, read_snapshot, read_stations,
+                          remove_ticket, show_seats, update_seat,
+                          write_reserved_tickets, write_seats, write_snapshot,
+                          write_stations)
+
+
+def make_stations(num_stations, num_classes, seed=0):
+    """ Return ticket fees and station indexes of a synthetic line
+        Station 0 is 'Station 0' with fee 0; each next station costs 20 to 80
+            more in class 1, and class c costs (1 - 0.2 * (c - 1)) times
+            class 1, so lower classes are cheaper as in the real lines.
+
+        :param num_stations: int
+        :param num_classes: int
+        :param seed: int
+        :return: StationFees, StationIndexes
+        >>> fees, indexes = make_stations(3, 2)
+        >>> indexes
+        {'Station 0': 0, 'Station 1': 1, 'Station 2': 2}
+        >>> fees
+        {'Station 0': [0, 0], 'Station 1': [74, 59], 'Station 2': [118, 94]}
+    """
+    rng = random.Random(seed)
+    station_fees = StationFees()
+    station_indexes = StationIndexes()
+    fare = 0
+    for i in range(num_stations):
+        name = f"Station {i}"
+        station_fees[name] = [int(fare * (1 - 0.2 * c))
+                              for c in range(num_classes)]
+        station_indexes[name] = i
+        fare += rng.randint(20, 80)
+    station_fees.index_fares(station_indexes)
+    return station_fees, station_indexes
+
+
+def make_seats(station_indexes, num_seats, num_classes):
+    """ Return a dictionary of num_seats empty SeatTickets seats, split
+        evenly over num_classes classes
+        Seats are named class, row and letter (A to D), e.g. '112C'.
+
+        :param station_indexes: dictionary of station indexes
+        :param num_seats: int
+        :param num_classes: int
+        :return: dictionary of seats
+        >>> list(make_seats({'AA': 0, 'BB': 1}, 6, 2))
+        ['11A', '11B', '11C', '21A', '21B', '21C']
+    """
+    seats = {}
+    watchers = []
+    ticket_index = TicketIndex()
+    for c in range(1, num_classes + 1):
+        count = num_seats // num_classes + (c <= num_seats % num_classes)
+        for k in range(count):
+            seat = f"{c}{k // 4 + 1}{'ABCD'[k % 4]}"
+            seats[seat] = SeatTickets(station_indexes, seat=seat,
+                                      watchers=watchers, index=ticket_index)
+    return seats
+
+
+def random_journey(rng, num_stations):
+    """ Return a random (origin station index, dest station index)
+        Trip lengths follow a booking mix where short trips are common and
+            end-to-end trips are rare: the length is drawn from an
+            exponential distribution with mean a quarter of the line.
+
+        :param rng: random.Random
+        :param num_stations: int
+        :return: (int, int)
+        >>> rng = random.Random(1)
+        >>> [random_journey(rng, 10) for _ in range(3)]
+        [(1, 2), (7, 8), (3, 7)]
+    """
+    length = min(num_stations - 1,
+                 1 + int(rng.expovariate(4 / num_stations)))
+    origin_index = rng.randrange(num_stations - length)
+    return origin_index, origin_index + length
+
+
+def fill_seats(train_seats, station_indexes, load_factor, seed=0):
+    """ Reserve random journeys (see random_journey) on train_seats with
+        first_fit until load_factor of all (seat, station) pairs is taken,
+        or too many journeys in a row find no seat
+        Return the number of reserved tickets.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param load_factor: float from 0.0 to 1.0
+        :param seed: int
+        :return: int
+    """
+    rng = random.Random(seed)
+    num_stations = len(station_indexes)
+    finder = SeatFinder(train_seats, station_indexes)
+    target = load_factor * len(train_seats) * num_stations
+    taken = 0
+    tickets = 0
+    misses = 0
+    while taken < target and misses < 1000:
+        origin_index, dest_index = random_journey(rng, num_stations)
+        seat = first_fit(train_seats, station_indexes, origin_index,
+                         dest_index, None, finder)
+        if seat is None:
+            misses += 1
+            continue
+        misses = 0
+        update_seat(station_indexes, origin_index, dest_index,
+                    train_seats[seat])
+        taken += dest_index - origin_index + 1
+        tickets += 1
+    return tickets
+
+
+def generate_line(directory, num_stations, num_seats, num_classes,
+                  load_factor, seed=0):
+    """ Write a synthetic line to directory as stations.txt, seats.txt and
+        tickets.txt, in the formats of read_stations, read_seats and
+        read_reserved_tickets
+        Return the three file names.
+
+        :param directory: string
+        :param num_stations: int
+        :param num_seats: int
+        :param num_classes: int
+        :param load_factor: float from 0.0 to 1.0
+        :param seed: int
+        :return: (string, string, string)
+    """
+    station_fees, station_indexes = make_stations(num_stations, num_classes,
+                                                  seed)
+    train_seats = make_seats(station_indexes, num_seats, num_classes)
+    fill_seats(train_seats, station_indexes, load_factor, seed)
+    filenames = tuple(os.path.join(directory, x) for x in (
+        'stations.txt', 'seats.txt', 'tickets.txt'))
+    write_stations(filenames[0], station_fees, station_indexes)
+    write_seats(filenames[1], train_seats)
+    write_reserved_tickets(filenames[2], train_seats)
+    return filenames
+
+
+def time_operation(operation, arguments, repeat=3):
+    """ Call operation(*x) for each x in arguments, repeat times, and
+        return the shortest total time in seconds
+
+        :param operation: function
+        :param arguments: list of tuples
+        :param repeat: int
+        :return: float
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for x in arguments:
+            operation(*x)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best
+
+
+def run_benchmarks(station_filename, seat_filename, ticket_filename,
+                   num_operations=1000, repeat=3, seed=0):
+    """ Time loading and the main operations on one line
+        Return a dictionary where key is benchmark name, and value is a
+            dictionary with 'operations', 'seconds' (best total of repeat
+            runs) and 'us_per_operation'.
+
+        :param station_filename: string
+        :param seat_filename: string
+        :param ticket_filename: string
+        :param num_operations: int
+        :param repeat: int
+        :param seed: int
+        :return: dictionary
+    """
+    rng = random.Random(seed)
+    results = {}
+
+    def record(name, operation, arguments):
+        seconds = time_operation(operation, arguments, repeat)
+        results[name] = {'operations': len(arguments), 'seconds': seconds,
+                         'us_per_operation': seconds / len(arguments) * 1e6}
+
+    def load_text():
+        station_fees, station_indexes = read_stations(station_filename)
+        train_seats, _ = read_seats(seat_filename, station_indexes)
+        read_reserved_tickets(ticket_filename, train_seats, station_indexes)
+        return station_fees, station_indexes, train_seats
+
+    record('load_text', load_text, [()])
+    station_fees, station_indexes, train_seats = load_text()
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_filename = os.path.join(directory, 'train.snapshot')
+        write_snapshot(snapshot_filename, station_fees, station_indexes,
+                       train_seats)
+        record('load_snapshot', read_snapshot, [(snapshot_filename,)])
+
+    num_stations = len(station_indexes)
+    journeys = [random_journey(rng, num_stations)
+                for _ in range(num_operations)]
+    record('search_scan', find_available_seats,
+           [(train_seats, station_indexes, o, d) for o, d in journeys])
+    finder = SeatFinder(train_seats, station_indexes)
+    record('search_finder', first_fit,
+           [(train_seats, station_indexes, o, d, None, finder)
+            for o, d in journeys])
+    cache = AvailabilityCache(train_seats, station_indexes)
+    record('search_cache', cache.available, journeys)
+    seat_classes = sorted({int(i[0]) for i in train_seats})
+    record('ticket_price', get_ticket_price,
+           [(station_indexes, station_fees, o, d, rng.choice(seat_classes))
+            for o, d in journeys])
+
+    tickets = [(i, o, d) for i in train_seats
+               for o, d in get_ticket_routes(station_indexes, train_seats[i])]
+    tickets = rng.sample(tickets, min(num_operations, len(tickets)))
+    if tickets:
+        def cancel_and_restore(seat, origin_index, dest_index):
+            remove_ticket(train_seats, station_indexes, seat, origin_index,
+                          dest_index)
+            update_seat(station_indexes, origin_index, dest_index,
+                        train_seats[seat])
+
+        record('cancel_and_restore', cancel_and_restore, tickets)
+
+    record('show_seats', show_seats,
+           [(train_seats, station_indexes, None, None, None, 50,
+             io.StringIO())])
+    return results
+
+
+def compare_results(old, new):
+    """ Return lines comparing the us_per_operation of two benchmark result
+        dictionaries (see run_benchmarks), with new / old ratio
+
+        :param old: dictionary
+        :param new: dictionary
+        :return: list of strings
+        >>> for line in compare_results( \
+            {'search_scan': {'us_per_operation': 100.0}}, \
+            {'search_scan': {'us_per_operation': 25.0}, \
+             'show_seats': {'us_per_operation': 10.0}}): \
+            print(line)
+        benchmark             old us    new us   new/old
+        search_scan            100.0      25.0      0.25
+        show_seats                 -      10.0         -
+    """
+    lines = [f"{'benchmark':<18}{'old us':>10}{'new us':>10}{'new/old':>10}"]
+    for name in new:
+        new_us = new[name]['us_per_operation']
+        if name in old:
+            old_us = old[name]['us_per_operation']
+            lines.append(f"{name:<18}{old_us:>10.1f}{new_us:>10.1f}"
+                         f"{new_us / old_us:>10.2f}")
+        else:
+            lines.append(f"{name:<18}{'-':>10}{new_us:>10.1f}{'-':>10}")
+    return lines
+
+
+def main(argv=None):
+    """ Entry point: generate a line, run the benchmarks and write JSON
+        results, see --help
+        --doctest runs the doctests instead.
+
+        :param argv: list of strings, or None for sys.argv[1:]
+        :return: nothing
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark train reservation on a synthetic line")
+    parser.add_argument('--doctest', action='store_true',
+                        help="run the doctests of this module and exit")
+    parser.add_argument('--stations', type=int, default=30)
+    parser.add_argument('--seats', type=int, default=1000)
+    parser.add_argument('--classes', type=int, default=3)
+    parser.add_argument('--load', type=float, default=0.6,
+                        help="share of (seat, station) pairs reserved")
+    parser.add_argument('--operations', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--directory',
+                        help="keep the generated files in this directory")
+    parser.add_argument('--output', help="write JSON results to this file")
+    parser.add_argument('--compare', metavar='FILE',
+                        help="compare with JSON results of an earlier run")
+    args = parser.parse_args(argv)
+    if args.doctest:
+        import doctest
+
+        doctest.testmod(sys.modules[__name__])
+        return
+
+    config = {'stations': args.stations, 'seats': args.seats,
+              'classes': args.classes, 'load': args.load,
+              'operations': args.operations, 'repeat': args.repeat,
+              'seed': args.seed}
+    with tempfile.TemporaryDirectory() as directory:
+        if args.directory:
+            os.makedirs(args.directory, exist_ok=True)
+            directory = args.directory
+        filenames = generate_line(directory, args.stations, args.seats,
+                                  args.classes, args.load, args.seed)
+        results = run_benchmarks(*filenames, args.operations, args.repeat,
+                                 args.seed)
+    report = {'config': config, 'python': platform.python_version(),
+              'results': results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print("\n".join(compare_results(old['results'], results)))
+    elif not args.output:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+from itertools import accumulate
+
+
 def get_station_index(station_indexes, _station_name):
     return station_indexes[_station_name]
 
@@ -22,13 +25,9 @@ def check_reserved_routes(station_indexes, ticket_list):
             [{'origin': 'BB', 'dest': 'EE'}])
         [0, 1, 1, 1, 1]
     """
-    reserved = [0 for _ in range(len(station_indexes))]
-    for i in range(len(station_indexes)):
-        for j in range(len(ticket_list)):
-            origin = get_station_index(station_indexes, ticket_list[j]['origin'])
-            dest = get_station_index(station_indexes, ticket_list[j]['dest'])
-            # print(f"{i} is in rang {origin}-{dest} = {i in range(origin,dest+1)}")
-            reserved[i] = int((i in range(origin, dest+1)) or reserved[i])
-
-    return reserved
+    diff = [0] * (len(station_indexes) + 1)
+    for ticket in ticket_list:
+        diff[get_station_index(station_indexes, ticket['origin'])] += 1
+        diff[get_station_index(station_indexes, ticket['dest']) + 1] -= 1
+    return [int(x > 0) for x in accumulate(diff[:-1])]
 # some
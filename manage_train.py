@@ -1,4 +1,41 @@
-def read_stations(station_filename):
+import argparse
+import csv
+import datetime
+import heapq
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import reduce
+from itertools import accumulate, chain, repeat
+from operator import or_
+
+np = None  # NumPy module, imported by import_numpy when first needed
+
+
+def import_numpy():
+    """ Import NumPy on first use, so importing this module stays fast
+        Return the numpy module, or None if NumPy is not installed.
+
+        :return: module or None
+    """
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            return None
+    return np
+
+
+def read_stations(station_filename, station_names=None):
     """ Read station file
         Read one line as one string and use , to split into multiple values
         Each line contains n+1 values: station X (string),
@@ -17,75 +54,709 @@ def read_stations(station_filename):
             where key is station X (string), and
                   value is station index (int)
                   Bangkok station has station index = 0
+            It also keeps the list of station names by station index,
+                so get_station_name does not have to search the dictionary.
+        The dictionary of ticket prices also keeps the prices of each class
+            by station index, and for lines with at most
+            FARE_MATRIX_MAX_STATIONS stations, the prices of all classes for
+            every origin and destination (see StationFees).
+        If station_names (dictionary where key and value are the same
+            station name) is given, station names are taken from it and new
+            names are added to it, so lines sharing stations share the names.
 
     :param station_filename: string
+    :param station_names: dictionary of station names (optional)
     :return: dictionary of ticket prices, and dictionary of station indexes
     """
     lines = open(station_filename).read().splitlines()
     table = [x.split(",") for x in lines if x != ""]
-    station_fees = {}
-    station_indexes = {}
-    station_fees = {}
+    station_indexes = StationIndexes()
+    station_fees = StationFees()
     for i in range(len(table)):
         temp_station_fees = []
         for j in range(1, len(table[0])):
             temp_station_fees.append(int(table[i][j]))
-        station_fees[table[i][0]] = temp_station_fees
-        station_indexes[table[i][0]] = i
+        name = table[i][0]
+        if station_names is not None:
+            name = station_names.setdefault(name, name)
+        station_fees[name] = temp_station_fees
+        station_indexes[name] = i
+    station_fees.index_fares(station_indexes)
     return station_fees, station_indexes
 
 
-def read_seats(seat_filename):
+class StationIndexes(dict):
+    """ Dictionary of station indexes that also keeps names, the list of
+        station names by station index, in sync with the dictionary
+        Station indexes are 0, 1, ..., number of stations - 1.
+
+        >>> station_indexes = StationIndexes({'AA': 0, 'BB': 1})
+        >>> station_indexes['CC'] = 2
+        >>> station_indexes
+        {'AA': 0, 'BB': 1, 'CC': 2}
+        >>> station_indexes.names
+        ['AA', 'BB', 'CC']
+        >>> del station_indexes['CC']
+        >>> station_indexes.names
+        ['AA', 'BB']
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._update_names()
+
+    def _update_names(self):
+        self.names = [None] * len(self)
+        for key, value in self.items():
+            if value >= len(self.names):
+                self.names.extend([None] * (value + 1 - len(self.names)))
+            self.names[value] = key
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self.names[dict.__getitem__(self, key)] = None
+        super().__setitem__(key, value)
+        if value >= len(self.names):
+            self.names.extend([None] * (value + 1 - len(self.names)))
+        self.names[value] = key
+
+    def __delitem__(self, key):
+        value = dict.__getitem__(self, key)
+        super().__delitem__(key)
+        self.names[value] = None
+        while self.names and self.names[-1] is None:
+            self.names.pop()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._update_names()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return super().pop(key, *default)
+
+    def popitem(self):
+        item = super().popitem()
+        self._update_names()
+        return item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def clear(self):
+        super().clear()
+        self.names = []
+
+
+FARE_MATRIX_MAX_STATIONS = 64
+
+
+class StationFees(dict):
+    """ Dictionary of ticket fees that can also keep the fees by station index
+        After index_fares(station_indexes), fares[c][i] is the ticket price of
+            class c + 1 between Bangkok and station index i, so the price
+            between two station indexes is one subtraction (see
+            get_ticket_price).  If there are at most max_matrix_stations
+            stations, matrix[origin_index][dest_index] is also the list of
+            ticket prices of all classes.
+        Changing the dictionary drops fares and matrix until index_fares is
+            called again.
+
+        >>> station_fees = StationFees({'AA': [0, 0], 'BB': [200, 100], \
+            'CC': [275, 150]})
+        >>> station_fees.index_fares({'AA': 0, 'BB': 1, 'CC': 2})
+        >>> station_fees.fares
+        [[0, 200, 275], [0, 100, 150]]
+        >>> station_fees.matrix[1][2]
+        [75, 50]
+        >>> station_fees['DD'] = [300, 200]
+        >>> station_fees.fares is None
+        True
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fares = None
+        self.matrix = None
+
+    def index_fares(self, station_indexes,
+                    max_matrix_stations=FARE_MATRIX_MAX_STATIONS):
+        names = [get_station_name(station_indexes, i)
+                 for i in range(len(station_indexes))]
+        num_classes = len(self[names[0]]) if names else 0
+        self.fares = [[self[name][c] for name in names]
+                      for c in range(num_classes)]
+        self.matrix = None
+        if len(names) <= max_matrix_stations:
+            self.matrix = [[[fares[d] - fares[o] for fares in self.fares]
+                            for d in range(len(names))]
+                           for o in range(len(names))]
+
+    def _drop_fares(self):
+        self.fares = None
+        self.matrix = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._drop_fares()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._drop_fares()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._drop_fares()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def pop(self, *args):
+        self._drop_fares()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._drop_fares()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def clear(self):
+        super().clear()
+        self._drop_fares()
+
+
+def read_seats(seat_filename, station_indexes=None):
     """ Read seat file
         Read one line as one string and return 2 items
         1) dictionary of seats: key is seat, and value is an empty ticket list
+            (SeatTickets if station_indexes is given, otherwise list)
         2) list of seat classes
 
         :param seat_filename: string
+        :param station_indexes: dictionary of station indexes (optional)
         :return: dictionary of seats, and list of seat classes
     """
     lines = open(seat_filename).read().splitlines()
     seats = {}
     seat_classes = []
+    watchers = []
+    ticket_index = TicketIndex()
     for x in lines:
-        seats[x] = []
+        seats[x] = [] if station_indexes is None else \
+            SeatTickets(station_indexes, seat=x, watchers=watchers,
+                        index=ticket_index)
         temp_seat_class = int(x[0])
         if not (temp_seat_class in seat_classes):
             seat_classes.append(temp_seat_class)
     return seats, seat_classes
 
 
-def read_reserved_tickets(ticket_filename, seats):
+def read_reserved_tickets(ticket_filename, seats, station_indexes=None):
     """ Read reserved ticket file
-        Read one line as one string and use , to split into multiple values
+        Read one line at a time and use , to split into multiple values, so
+            the whole file is never held in memory
         Each line contains 3 values: seat (string),
             origin station name (string),
-            destination station name (string)
+            destination station name (string),
+            and optionally a 4th, the ticket id (positive int, see
+            write_reserved_tickets)
         For each reserved ticket at seat S,
             add a ticket dictionary with origin and destination stations
-            to seat S in dictionary of seats
-        Note that no value is returned here.  If values inside dictionary
-            seats are changed, dictionary seats will be updated as well.
+            to seat S in dictionary of seats.  SeatTickets seats give the
+            ticket its saved id.
+        Station names are shared between tickets instead of one string per
+            ticket.  SeatTickets seats only keep the station indexes.
+        A malformed line (not 3 or 4 values, unknown seat, ticket id that is
+            not a positive int, or, if station_indexes is given, unknown
+            station or destination not after origin) is skipped.
+        Return a list of (line number, reason) of skipped lines.  If values
+            inside dictionary seats are changed, dictionary seats will be
+            updated as well.
+
+    :param ticket_filename: string
+    :param seats: dictionary of seats
+    :param station_indexes: dictionary of station indexes (optional)
+    :return: list of (int, string)
+    """
+    errors = []
+    names = {} if station_indexes is None else \
+        {name: name for name in station_indexes}
+    with open(ticket_filename) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip("\r\n")
+            if line == "":
+                continue
+            row = line.split(",")
+            if len(row) not in (3, 4):
+                errors.append((line_number, "expected seat,origin,dest"))
+                continue
+            ticket_id = 0
+            if len(row) == 4:
+                if not row[3].isdigit() or int(row[3]) == 0:
+                    errors.append((line_number, f"invalid ticket id {row[3]}"))
+                    continue
+                ticket_id = int(row[3])
+            seat_num = row[0]
+            if seat_num not in seats:
+                errors.append((line_number, f"unknown seat {seat_num}"))
+                continue
+            origin = names.get(row[1])
+            dest = names.get(row[2])
+            if station_indexes is None:
+                if origin is None:
+                    origin = names.setdefault(row[1], sys.intern(row[1]))
+                if dest is None:
+                    dest = names.setdefault(row[2], sys.intern(row[2]))
+            elif origin is None or dest is None:
+                errors.append((line_number, "unknown station "
+                               f"{row[1] if origin is None else row[2]}"))
+                continue
+            elif station_indexes[dest] <= station_indexes[origin]:
+                errors.append((line_number, "destination is not after origin"))
+                continue
+
+            if isinstance(seats[seat_num], SeatTickets) and \
+                    station_indexes is not None:
+                seats[seat_num].add(station_indexes[origin],
+                                    station_indexes[dest], ticket_id)
+                continue
+            try:
+                seats[seat_num].append({'origin': origin, 'dest': dest})
+            except KeyError as e:
+                errors.append((line_number, f"unknown station {e.args[0]}"))
+    return errors
+
+
+def write_reserved_tickets(ticket_filename, seats):
+    """ Write reserved ticket file in the format read by read_reserved_tickets
+        One line per ticket: seat,origin station name,destination station name
+            and, for SeatTickets seats, ,ticket id
+        The file is written to a temporary file first and then replaces
+            ticket_filename, so a crash never leaves a half written file.
 
     :param ticket_filename: string
     :param seats: dictionary of seats
     :return: nothing
     """
-    lines = open(ticket_filename).read().splitlines()
-    table = [x.split(",") for x in lines if x != ""]
-    for row in table:
-        seat_num = row[0]
-        pax = {'origin': row[1], 'dest': row[2]}
-        seats[seat_num].append(pax)
+    temp_filename = ticket_filename + '.tmp'
+    with open(temp_filename, 'w') as f:
+        for seat in seats:
+            if isinstance(seats[seat], SeatTickets):
+                for j, ticket_id in zip(seats[seat], seats[seat].ids):
+                    f.write(f"{seat},{j['origin']},{j['dest']},{ticket_id}\n")
+                continue
+            for j in seats[seat]:
+                f.write(f"{seat},{j['origin']},{j['dest']}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, ticket_filename)
+
+
+class TicketJournal:
+    """ Append-only journal of ticket changes made after the reserved ticket
+        file was read
+        One line per change:
+            R,seat,origin station name,destination station name  (reserve)
+            C,seat,origin station name,destination station name  (cancel)
+            X                                                    (clear)
+            I,last ticket id                     (after compaction, see below)
+        R and C lines end with ,ticket id when the ticket has one (see
+            TicketIndex); a C line without it cancels by journey.
+        Opening the journal replays it on top of train_seats, which must
+            already hold the tickets of ticket_filename.  The journal file
+            is opened for appending (and made, if there is none) only when
+            the first change is recorded, so reading tickets leaves no file
+            behind.
+        Lines are flushed after each change and synced to disk (fsync) after
+            every sync_every changes and on close.  After compact_every
+            changes, train_seats is written back to ticket_filename and the
+            journal is emptied except for an I line, which keeps the last
+            ticket id given out so that ids of canceled tickets are never
+            given again.
+        lock is held while a line is appended.  Hold it while changing a
+            seat and recording the change, so that compaction never sees a
+            change without its line (see ReservationEngine).
+
+        :param ticket_filename: string
+        :param journal_filename: string
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param sync_every: int
+        :param compact_every: int
+    """
+
+    def __init__(self, ticket_filename, journal_filename, train_seats,
+                 station_indexes, sync_every=64, compact_every=10000):
+        self.ticket_filename = ticket_filename
+        self.journal_filename = journal_filename
+        self.train_seats = train_seats
+        self.station_indexes = station_indexes
+        self.sync_every = sync_every
+        self.compact_every = compact_every
+        self.records = replay_journal(journal_filename, train_seats,
+                                      station_indexes)
+        self.unsynced = 0
+        self.file = None
+        self.lock = threading.RLock()
+
+    def _open(self):
+        # the caller holds self.lock
+        if self.file is None:
+            self.file = open(self.journal_filename, 'a')
+        return self.file
+
+    def _append(self, line):
+        with self.lock:
+            self._open().write(line + "\n")
+            self.file.flush()
+            self.records += 1
+            self.unsynced += 1
+            if self.records >= self.compact_every:
+                self.compact()
+            elif self.unsynced >= self.sync_every:
+                self.sync()
+
+    def reserve(self, seat, origin, dest, ticket_id=None):
+        self._append(f"R,{seat},{origin},{dest}"
+                     + ("" if ticket_id is None else f",{ticket_id}"))
+
+    def cancel(self, seat, origin, dest, ticket_id=None):
+        self._append(f"C,{seat},{origin},{dest}"
+                     + ("" if ticket_id is None else f",{ticket_id}"))
+
+    def clear(self):
+        self._append("X")
+
+    def sync(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    def compact(self):
+        """ Write train_seats back to the ticket file and empty the journal
+            Nothing is done if no change was recorded or replayed.
+        """
+        with self.lock:
+            if self.file is None and not self.records:
+                return
+            self._open()
+            self.sync()
+            write_reserved_tickets(self.ticket_filename, self.train_seats)
+            self.file.truncate(0)
+            self.file.seek(0)
+            ticket_index = get_ticket_index(self.train_seats)
+            if ticket_index is not None:
+                self.file.write(f"I,{ticket_index.last_id}\n")
+            self.sync()
+            self.records = 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.sync()
+                self.file.close()
+                self.file = None
+
+
+def replay_journal(journal_filename, train_seats, station_indexes):
+    """ Apply changes recorded by TicketJournal to train_seats
+        A last line without newline (a change cut off by a crash) is ignored
+            and removed from the journal.
+        A reserve whose ticket id is already taken, or a cancel whose ticket
+            id is gone, was already written to the ticket file (a crash
+            during compaction), so it is skipped.
+        Return the number of replayed changes.
+
+    :param journal_filename: string
+    :param train_seats: dictionary of seats
+    :param station_indexes: dictionary of station indexes
+    :return: int
+    """
+    if not os.path.exists(journal_filename):
+        return 0
+    count = 0
+    with open(journal_filename, 'r+') as f:
+        end = 0
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            end += len(line.encode())
+            row = line.rstrip("\n").split(",")
+            tickets = train_seats[row[1]] if row[0] in ('R', 'C') else None
+            ticket_id = int(row[4]) if len(row) == 5 and \
+                isinstance(tickets, SeatTickets) else None
+            if row[0] == 'R':
+                if ticket_id is None:
+                    update_seat(station_indexes, station_indexes[row[2]],
+                                station_indexes[row[3]], tickets)
+                elif ticket_id not in tickets.index.tickets:
+                    tickets.add(station_indexes[row[2]],
+                                station_indexes[row[3]], ticket_id)
+            elif row[0] == 'C':
+                if ticket_id is None:
+                    remove_ticket(train_seats, station_indexes, row[1],
+                                  station_indexes[row[2]],
+                                  station_indexes[row[3]])
+                else:
+                    tickets.discard_id(ticket_id)
+            elif row[0] == 'X':
+                for i in train_seats.keys():
+                    train_seats[i].clear()
+            elif row[0] == 'I':
+                ticket_index = get_ticket_index(train_seats)
+                if ticket_index is not None:
+                    ticket_index.last_id = max(ticket_index.last_id,
+                                               int(row[1]))
+                continue
+            count += 1
+        f.truncate(end)
+    return count
+
+
+def write_stations(station_filename, station_fees, station_indexes):
+    """ Write station file in the format read by read_stations
 
+    :param station_filename: string
+    :param station_fees: dictionary of ticket fees
+    :param station_indexes: dictionary of station indexes
+    :return: nothing
+    """
+    with open(station_filename, 'w') as f:
+        for i in range(len(station_indexes)):
+            name = get_station_name(station_indexes, i)
+            f.write(",".join([name] + [str(x) for x in station_fees[name]])
+                    + "\n")
+
+
+def write_seats(seat_filename, seats):
+    """ Write seat file in the format read by read_seats
+
+    :param seat_filename: string
+    :param seats: dictionary of seats
+    :return: nothing
+    """
+    with open(seat_filename, 'w') as f:
+        for seat in seats:
+            f.write(seat + "\n")
+
+
+SNAPSHOT_MAGIC = b'TRAINSNP'
+# version 1 has no ticket ids
+SNAPSHOT_VERSION = 2
+# magic, version, number of stations, seat classes, seats and tickets
+SNAPSHOT_HEADER = struct.Struct('<8sIIIII')
+
+
+def write_snapshot(snapshot_filename, station_fees, station_indexes,
+                   train_seats):
+    """ Write stations, ticket fees, seats and reserved tickets to one binary
+        snapshot file that read_snapshot loads without parsing text
+        Layout (little-endian):
+            header (SNAPSHOT_HEADER),
+            last ticket id (uint32, see TicketIndex),
+            length of names (uint32) and names: station names by station
+                index, then seats, separated by newline (utf-8),
+            ticket fees by station index and class (int32),
+            number of tickets of each seat (uint32),
+            origin station indexes of all tickets (uint16),
+            dest station indexes of all tickets (uint16),
+            ticket ids of all tickets (uint32, 0 for list seats)
+
+    :param snapshot_filename: string
+    :param station_fees: dictionary of ticket fees
+    :param station_indexes: dictionary of station indexes
+    :param train_seats: dictionary of seats
+    :return: nothing
+    """
+    station_names = [get_station_name(station_indexes, i)
+                     for i in range(len(station_indexes))]
+    num_classes = len(station_fees[station_names[0]]) if station_names else 0
+    names = "\n".join(station_names + list(train_seats)).encode()
+    fees = array('i', [fee for name in station_names
+                       for fee in station_fees[name]])
+    counts = array('I', [len(train_seats[i]) for i in train_seats])
+    origins = array('H')
+    dests = array('H')
+    ids = array('I')
+    for i in train_seats:
+        for origin_index, dest_index in get_ticket_routes(station_indexes,
+                                                          train_seats[i]):
+            origins.append(origin_index)
+            dests.append(dest_index)
+        if isinstance(train_seats[i], SeatTickets):
+            ids.extend(train_seats[i].ids)
+        else:
+            ids.extend([0] * len(train_seats[i]))
+    ticket_index = get_ticket_index(train_seats)
+    last_id = 0 if ticket_index is None else ticket_index.last_id
+    if sys.byteorder != 'little':
+        for column in (fees, counts, origins, dests, ids):
+            column.byteswap()
+
+    temp_filename = snapshot_filename + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                     len(station_names), num_classes,
+                                     len(train_seats), len(origins)))
+        f.write(struct.pack('<II', last_id, len(names)))
+        f.write(names)
+        for column in (fees, counts, origins, dests, ids):
+            column.tofile(f)
+    os.replace(temp_filename, snapshot_filename)
+
+
+def read_snapshot(snapshot_filename, station_names=None):
+    """ Read binary snapshot written by write_snapshot
+        The file is memory-mapped and each table is copied into an array as
+            a whole, so no fee or ticket is parsed from text.
+        Return the same 4 items as read_stations, read_seats and
+            read_reserved_tickets give: dictionary of ticket fees, dictionary
+            of station indexes, dictionary of seats, and list of seat classes
+        station_names is used as in read_stations.
+        Tickets get their saved ids.  A version 1 snapshot has none, so its
+            tickets get new ids.
+
+    :param snapshot_filename: string
+    :param station_names: dictionary of station names (optional)
+    :return: dictionary of ticket fees, dictionary of station indexes,
+        dictionary of seats, and list of seat classes
+    """
+    with open(snapshot_filename, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        magic, version, num_stations, num_classes, num_seats, num_tickets = \
+            SNAPSHOT_HEADER.unpack_from(m, 0)
+        if magic != SNAPSHOT_MAGIC or version not in (1, SNAPSHOT_VERSION):
+            raise ValueError(f"{snapshot_filename} is not a train snapshot")
+        pos = SNAPSHOT_HEADER.size
+        last_id = 0
+        if version > 1:
+            (last_id,) = struct.unpack_from('<I', m, pos)
+            pos += 4
+        (names_length,) = struct.unpack_from('<I', m, pos)
+        pos += 4
+        names = m[pos:pos + names_length].decode().split("\n")
+        pos += names_length
+        columns = []
+        for typecode, length in (('i', num_stations * num_classes),
+                                 ('I', num_seats), ('H', num_tickets),
+                                 ('H', num_tickets),
+                                 ('I', num_tickets if version > 1 else 0)):
+            column = array(typecode)
+            end = pos + length * column.itemsize
+            column.frombytes(m[pos:end])
+            pos = end
+            columns.append(column)
+    fees, counts, origins, dests, ids = columns
+    if sys.byteorder != 'little':
+        for column in columns:
+            column.byteswap()
+
+    if station_names is not None:
+        names[:num_stations] = [station_names.setdefault(name, name)
+                                for name in names[:num_stations]]
+    station_fees = StationFees()
+    station_indexes = StationIndexes()
+    for i, name in enumerate(names[:num_stations]):
+        station_fees[name] = fees[i * num_classes:(i + 1) * num_classes] \
+            .tolist()
+        station_indexes[name] = i
+    station_fees.index_fares(station_indexes)
+
+    train_seats = {}
+    train_seat_classes = []
+    watchers = []
+    ticket_index = TicketIndex()
+    ticket_index.last_id = last_id
+    if version == 1:
+        ids = array('I', range(last_id + 1, last_id + 1 + num_tickets))
+    k = 0
+    for seat, count in zip(names[num_stations:], counts):
+        tickets = SeatTickets(station_indexes, seat=seat, watchers=watchers,
+                              index=ticket_index)
+        tickets._load(origins[k:k + count], dests[k:k + count],
+                      ids[k:k + count])
+        k += count
+        train_seats[seat] = tickets
+        if int(seat[0]) not in train_seat_classes:
+            train_seat_classes.append(int(seat[0]))
+    ticket_index.fill(train_seats)
+    return station_fees, station_indexes, train_seats, train_seat_classes
+
+
+def convert_to_snapshot(station_filename, seat_filename, ticket_filename,
+                        snapshot_filename):
+    """ Convert station, seat and reserved ticket files to a binary snapshot
 
-def read_origin():
+    :param station_filename: string
+    :param seat_filename: string
+    :param ticket_filename: string
+    :param snapshot_filename: string
+    :return: list of (line number, reason) of skipped ticket lines
+    """
+    station_fees, station_indexes = read_stations(station_filename)
+    train_seats, _ = read_seats(seat_filename, station_indexes)
+    errors = read_reserved_tickets(ticket_filename, train_seats,
+                                   station_indexes)
+    write_snapshot(snapshot_filename, station_fees, station_indexes,
+                   train_seats)
+    return errors
+
+
+def convert_from_snapshot(snapshot_filename, station_filename, seat_filename,
+                          ticket_filename):
+    """ Convert a binary snapshot back to station, seat and reserved ticket
+        files
+
+    :param snapshot_filename: string
+    :param station_filename: string
+    :param seat_filename: string
+    :param ticket_filename: string
+    :return: nothing
+    """
+    station_fees, station_indexes, train_seats, _ = \
+        read_snapshot(snapshot_filename)
+    write_stations(station_filename, station_fees, station_indexes)
+    write_seats(seat_filename, train_seats)
+    write_reserved_tickets(ticket_filename, train_seats)
+
+
+def is_snapshot_current(snapshot_filename, filenames):
+    """ Return True if snapshot_filename exists and is newer than all files
+        in filenames, that is, the snapshot can be loaded instead of them
+
+    :param snapshot_filename: string
+    :param filenames: list of strings
+    :return: boolean value
+    """
+    if not os.path.exists(snapshot_filename):
+        return False
+    snapshot_time = os.path.getmtime(snapshot_filename)
+    return all(os.path.getmtime(x) <= snapshot_time for x in filenames)
+
+
+def read_origin(station_indexes):
     """ Read origin station index from user
         If user enters an invalid station index, report to user and
             continuously ask until a valid index is entered.
         Return origin station index (int)
 
-    :param: Nothing
+    :param station_indexes: dictionary of station indexes
     :return: int
     """
     while True:
@@ -95,7 +766,7 @@ def read_origin():
         print("Invalid origin station index.")
 
 
-def read_dest(origin_index):
+def read_dest(origin_index, station_indexes):
     """ Read destination station index  from user
         Receive origin station index as function input.
         If user enters an invalid station index, report to user and
@@ -105,6 +776,7 @@ def read_dest(origin_index):
         Return destination station index (int)
 
         :param: origin_index: int
+        :param station_indexes: dictionary of station indexes
         :return: int
     """
     while True:
@@ -143,30 +815,112 @@ def get_station_name(station_indexes, _station_index):
         'BB'
         >>> get_station_name({'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3}, 3)
         'DD'
+        >>> get_station_name(StationIndexes({'AA': 0, 'BB': 1, 'CC': 2}), 2)
+        'CC'
     """
+    names = getattr(station_indexes, 'names', None)
+    if names is not None:
+        if 0 <= _station_index < len(names):
+            return names[_station_index]
+        return None
     for key, value in station_indexes.items():
         if _station_index == value:
             return key
 
 
-def show_seats(seats, station_indexes):
+def get_station_names(station_indexes):
+    """ Return the list of station names in station index order
+
+        :param station_indexes: dictionary of station indexes
+        :return: list of strings
+        >>> get_station_names({'BB': 1, 'AA': 0})
+        ['AA', 'BB']
+    """
+    names = getattr(station_indexes, 'names', None)
+    if names is not None:
+        return names
+    return sorted(station_indexes, key=station_indexes.get)
+
+
+def select_seats(seats, seat_names=None, seat_class=None, page=None,
+                 page_size=50):
+    """ Return the list of seats to display: seats in seat_names (if given)
+        of seat_class (if given), and only page number page (from 1, if
+        given) of page_size seats
+
+        :param seats: dictionary of seats
+        :param seat_names: list of strings or None
+        :param seat_class: int or None
+        :param page: int or None
+        :param page_size: int
+        :return: list of strings
+        >>> select_seats({'1A': [], '1B': [], '2A': [], '2B': []}, \
+            seat_class=2)
+        ['2A', '2B']
+        >>> select_seats({'1A': [], '1B': [], '2A': [], '2B': []}, page=2, \
+            page_size=3)
+        ['2B']
+    """
+    selected = [i for i in seats
+                if (seat_names is None or i in seat_names) and
+                (seat_class is None or int(i[0]) == seat_class)]
+    if page is not None:
+        selected = selected[(page - 1) * page_size:page * page_size]
+    return selected
+
+
+def format_tickets(station_indexes, ticket_list, prices=None, names=None):
+    """ Return tickets of one seat as text: ' [origin(index)-dest(index)],'
+        for each ticket, with '-price' before ']' if prices is given
+
+        :param station_indexes: dictionary of station indexes
+        :param ticket_list: list of tickets
+        :param prices: list of ints or None
+        :param names: list of station names (see get_station_names) or None
+        :return: string
+        >>> format_tickets({'AA': 0, 'BB': 1, 'CC': 2}, \
+            [{'origin': 'AA', 'dest': 'BB'}, {'origin': 'BB', 'dest': 'CC'}])
+        ' [AA(0)-BB(1)], [BB(1)-CC(2)],'
+        >>> format_tickets({'AA': 0, 'BB': 1}, \
+            [{'origin': 'AA', 'dest': 'BB'}], [200])
+        ' [AA(0)-BB(1)-200],'
+    """
+    if names is None:
+        names = get_station_names(station_indexes)
+    routes = get_ticket_routes(station_indexes, ticket_list)
+    if prices is None:
+        return "".join(f" [{names[o]}({o})-{names[d]}({d})],"
+                       for o, d in routes)
+    return "".join(f" [{names[o]}({o})-{names[d]}({d})-{price}],"
+                   for (o, d), price in zip(routes, prices))
+
+
+def show_seats(seats, station_indexes, seat_names=None, seat_class=None,
+               page=None, page_size=50, file=None):
     """ Display reserved tickets from all seats
         Use information of ticket list inside each seat from dictionary of seats \
             and dictionary of station indexes to help display.
+        Only seats chosen by select_seats are shown.  The whole text is
+            built first and written at once.
 
         :param station_seats: dictionary of seats
         :param station_indexes: dictionary of station indexes
+        :param seat_names: list of strings or None
+        :param seat_class: int or None
+        :param page: int or None
+        :param page_size: int
+        :param file: file object or None for standard output
         :return: Nothing
+        >>> show_seats({'1A': [{'origin': 'AA', 'dest': 'BB'}], '2A': []}, \
+            {'AA': 0, 'BB': 1})
+        1A: [AA(0)-BB(1)],
+        2A:
     """
-    for i in seats:
-        text = f"{i}:"
-        for j in seats[i]:
-            origin = j['origin']
-            origin_index = get_station_index(station_indexes, origin)
-            dest = j['dest']
-            dest_index = get_station_index(station_indexes, dest)
-            text += f" [{origin}({origin_index})-{dest}({dest_index})],"
-        print(text)
+    names = get_station_names(station_indexes)
+    text = "".join(
+        f"{i}:{format_tickets(station_indexes, seats[i], names=names)}\n"
+        for i in select_seats(seats, seat_names, seat_class, page, page_size))
+    (sys.stdout if file is None else file).write(text)
 
 
 def check_reserved_routes(station_indexes, ticket_list):
@@ -175,6 +929,9 @@ def check_reserved_routes(station_indexes, ticket_list):
         The value is 1 if such station index is on any reserved ticket.
         The value if 0 if such station index is not on any reserved ticket.
         Return this list of 1's or 0's
+        Each ticket adds 1 at its origin and -1 after its destination in a
+            difference list; the running sum is then the number of tickets
+            on each station.
 
         :param station_indexes: dictionary of station indexes
         :param ticket_list: list of tickets
@@ -189,15 +946,11 @@ def check_reserved_routes(station_indexes, ticket_list):
             [{'origin': 'BB', 'dest': 'EE'}])
         [0, 1, 1, 1, 1]
     """
-    reserved = [0 for _ in range(len(station_indexes))]
-    for i in range(len(station_indexes)):
-        for j in range(len(ticket_list)):
-            origin = get_station_index(station_indexes,
-                                       ticket_list[j]['origin'])
-            dest = get_station_index(station_indexes, ticket_list[j]['dest'])
-            reserved[i] = int((i in range(origin, dest + 1)) or reserved[i])
-
-    return reserved
+    diff = [0] * (len(station_indexes) + 1)
+    for ticket in ticket_list:
+        diff[get_station_index(station_indexes, ticket['origin'])] += 1
+        diff[get_station_index(station_indexes, ticket['dest']) + 1] -= 1
+    return [int(x > 0) for x in accumulate(diff[:-1])]
 
 
 def is_ticket_available(reserved_routes, origin_index, dest_index):
@@ -225,6 +978,956 @@ def is_ticket_available(reserved_routes, origin_index, dest_index):
         [reserved_routes[i] == 0 for i in range(origin_index, dest_index + 1)])
 
 
+def get_route_mask(origin_index, dest_index):
+    """ Return the reserved routes of one ticket as an integer bitmask
+        Bit i is set if station index i is on the ticket, that is
+            origin_index <= i <= dest_index, the same stations that
+            check_reserved_routes marks with 1.
+
+        :param origin_index: int
+        :param dest_index: int
+        :return: int
+        >>> bin(get_route_mask(0, 2))
+        '0b111'
+        >>> bin(get_route_mask(3, 4))
+        '0b11000'
+        >>> get_route_mask(2, 2)
+        4
+    """
+    return (1 << (dest_index + 1)) - (1 << origin_index)
+
+
+class TicketIndex:
+    """ Ids of the tickets of one train
+        Every ticket added to SeatTickets gets the next id.  tickets maps
+            ticket id to the SeatTickets of its seat, and routes maps (seat,
+            origin index, dest index) to the id of such ticket, or to the
+            list of ids if the seat has several such tickets, so a ticket is
+            found by id or by journey without looking through the tickets
+            of other seats, and identical tickets keep their own ids.  The
+            position of a ticket is looked up in the ids of its seat.
+        Seats of one train share one TicketIndex (see read_seats), so ids are
+            unique in the train.  Ids are saved with the tickets (see
+            write_reserved_tickets, TicketJournal and write_snapshot) and
+            given back to them when they are read, and last_id is saved by
+            TicketJournal.compact, so an id is never given to two tickets,
+            even after a restart.
+        lock is held by SeatTickets while tickets are added or removed, so
+            threads changing different seats at once (see ReservationEngine)
+            never give two tickets one id or leave index and seats apart.
+        >>> ticket_index = TicketIndex()
+        >>> tickets = SeatTickets(StationIndexes({'AA': 0, 'BB': 1}), \
+            seat='1A', index=ticket_index)
+        >>> tickets.add(0, 1), tickets.add(0, 1)
+        (1, 2)
+        >>> ticket_index.find(2), ticket_index.routes
+        (('1A', 0, 1), {('1A', 0, 1): [1, 2]})
+        >>> ticket_index.discard(1), ticket_index.find(1), len(tickets)
+        (True, None, 1)
+        >>> ticket_index.routes
+        {('1A', 0, 1): 2}
+        >>> tickets.add(0, 1, ticket_id=9), tickets.add(0, 1, ticket_id=9)
+        (9, 10)
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self.tickets = {}
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def _add_route(self, key, ticket_id):
+        # the caller holds self.lock
+        ids = self.routes.get(key)
+        if ids is None:
+            self.routes[key] = ticket_id
+        elif isinstance(ids, list):
+            ids.append(ticket_id)
+        else:
+            self.routes[key] = [ids, ticket_id]
+
+    def fill(self, train_seats):
+        """ Index all tickets of the SeatTickets seats of train_seats that
+            share this index at once, in place of tickets and routes (for
+            loading seats whose arrays were filled directly)
+            A ticket whose id is 0 or was given to an earlier ticket gets the
+            next id.
+        """
+        seats = [x for x in train_seats.values()
+                 if isinstance(x, SeatTickets) and x.index is self]
+        with self.lock:
+            ids = array('I', chain.from_iterable(x.ids for x in seats))
+            self.last_id = max(self.last_id, max(ids, default=0))
+            if 0 in ids or len(set(ids)) < len(ids):
+                seen = set()
+                for tickets in seats:
+                    for k, ticket_id in enumerate(tickets.ids):
+                        if not ticket_id or ticket_id in seen:
+                            self.last_id += 1
+                            ticket_id = tickets.ids[k] = self.last_id
+                        seen.add(ticket_id)
+                ids = array('I', chain.from_iterable(x.ids for x in seats))
+            self.tickets = dict(zip(ids, chain.from_iterable(
+                repeat(x, len(x)) for x in seats)))
+            keys = list(zip(
+                chain.from_iterable(repeat(x.seat, len(x)) for x in seats),
+                chain.from_iterable(x.origins for x in seats),
+                chain.from_iterable(x.dests for x in seats)))
+            self.routes = dict(zip(keys, ids))
+            if len(self.routes) < len(keys):  # a seat has a journey twice
+                self.routes = {}
+                for key, ticket_id in zip(keys, ids):
+                    self._add_route(key, ticket_id)
+
+    def find(self, ticket_id):
+        """ Return (seat, origin index, dest index) of ticket ticket_id, or
+            None if there is no such ticket
+        """
+        with self.lock:
+            tickets = self.tickets.get(ticket_id)
+            if tickets is None:
+                return None
+            k = tickets.ids.index(ticket_id)
+            return tickets.seat, tickets.origins[k], tickets.dests[k]
+
+    def discard(self, ticket_id):
+        """ Remove ticket ticket_id
+            Return True if there was such ticket.  Otherwise, return False.
+        """
+        tickets = self.tickets.get(ticket_id)
+        return tickets is not None and tickets.discard_id(ticket_id)
+
+    def check(self, train_seats):
+        """ Return the number of tickets of SeatTickets seats in train_seats
+            that are missing from tickets or routes, plus the number of
+            index entries without such ticket (0 if index and seats agree)
+        """
+        with self.lock:
+            errors = 0
+            count = 0
+            for tickets in train_seats.values():
+                if not isinstance(tickets, SeatTickets) or \
+                        tickets.index is not self:
+                    continue
+                for ticket_id, route in zip(tickets.ids, tickets.routes()):
+                    ids = self.routes.get((tickets.seat, *route))
+                    errors += self.tickets.get(ticket_id) is not tickets or \
+                        ticket_id not in (ids if isinstance(ids, list)
+                                          else [ids])
+                    count += 1
+            routes = sum(len(x) if isinstance(x, list) else 1
+                         for x in self.routes.values())
+            return errors + abs(len(self.tickets) - count) + \
+                abs(routes - count)
+
+
+class SeatTickets:
+    """ Ticket list of one seat, stored compactly
+        Instead of one dictionary per ticket, tickets are kept as two arrays
+            of station indexes, origins and dests, and the reserved routes of
+            the seat as an integer bitmask in mask (see get_route_mask).
+            ids holds the ticket id of each ticket (see TicketIndex).
+        It still works like a list of ticket dictionaries: iterating, indexing
+            and printing give {'origin': name, 'dest': name} made on the fly,
+            and append, remove and clear take ticket dictionaries.
+        Use add, discard and routes to work with station indexes directly,
+            and discard_id to remove a ticket by id.  A removed ticket is
+            replaced by the last one, so the order of tickets may change.
+        After every change, refresh(seat) of each object in watchers is
+            called (see watch_seats).  Seats of one train share one watchers
+            list and one TicketIndex.
+
+        :param station_indexes: dictionary of station indexes
+        :param tickets: list of tickets
+        :param seat: string
+        :param watchers: list of objects with method refresh(seat)
+        :param index: TicketIndex or None (a new one is made)
+        >>> tickets = SeatTickets(StationIndexes({'AA': 0, 'BB': 1, 'CC': 2, \
+            'DD': 3}), [{'origin': 'AA', 'dest': 'BB'}])
+        >>> tickets.add(2, 3)
+        2
+        >>> tickets
+        [{'origin': 'AA', 'dest': 'BB'}, {'origin': 'CC', 'dest': 'DD'}]
+        >>> bin(tickets.mask)
+        '0b1111'
+        >>> tickets.discard(0, 1)
+        True
+        >>> tickets == [{'origin': 'CC', 'dest': 'DD'}]
+        True
+        >>> list(tickets.routes()), bin(tickets.mask), list(tickets.ids)
+        ([(2, 3)], '0b1100', [2])
+    """
+
+    __slots__ = ('station_indexes', 'origins', 'dests', 'ids', 'mask', 'seat',
+                 'watchers', 'index')
+    __hash__ = None
+
+    def __init__(self, station_indexes, tickets=(), seat=None, watchers=None,
+                 index=None):
+        self.station_indexes = station_indexes
+        self.origins = array('H')
+        self.dests = array('H')
+        self.ids = array('I')
+        self.mask = 0
+        self.seat = seat
+        self.watchers = [] if watchers is None else watchers
+        self.index = TicketIndex() if index is None else index
+        for j in tickets:
+            self.append(j)
+
+    def _changed(self):
+        for watcher in self.watchers:
+            watcher.refresh(self.seat)
+
+    def _add(self, origin_index, dest_index, ticket_id=0):
+        # the caller holds self.index.lock
+        index = self.index
+        if not ticket_id or ticket_id in index.tickets:
+            ticket_id = index.last_id + 1
+        index.last_id = max(index.last_id, ticket_id)
+        index.tickets[ticket_id] = self
+        index._add_route((self.seat, origin_index, dest_index), ticket_id)
+        self.ids.append(ticket_id)
+        self.origins.append(origin_index)
+        self.dests.append(dest_index)
+        self.mask |= get_route_mask(origin_index, dest_index)
+        return ticket_id
+
+    def add(self, origin_index, dest_index, ticket_id=0):
+        """ Add ticket between origin_index and dest_index and return its id
+            ticket_id (a saved id) is used if it is given and no other
+            ticket has it; otherwise the ticket gets the next id.
+        """
+        with self.index.lock:
+            ticket_id = self._add(origin_index, dest_index, ticket_id)
+        self._changed()
+        return ticket_id
+
+    def _load(self, origins, dests, ids):
+        # for read_snapshot: the arrays are kept as they are, and the caller
+        # indexes the tickets with TicketIndex.fill
+        self.origins, self.dests, self.ids = origins, dests, ids
+        self.mask = reduce(or_, map(get_route_mask, origins, dests), 0)
+
+    def _remove(self, ticket_id):
+        # the caller holds self.index.lock
+        index = self.index
+        k = self.ids.index(ticket_id)
+        del index.tickets[ticket_id]
+        key = (self.seat, self.origins[k], self.dests[k])
+        ids = index.routes[key]
+        if not isinstance(ids, list):
+            del index.routes[key]
+        else:
+            ids.remove(ticket_id)
+            if len(ids) == 1:
+                index.routes[key] = ids[0]
+        last = len(self.ids) - 1
+        if k != last:
+            self.origins[k] = self.origins[last]
+            self.dests[k] = self.dests[last]
+            self.ids[k] = self.ids[last]
+        self.origins.pop()
+        self.dests.pop()
+        self.ids.pop()
+        # tickets of one seat may share stations (e.g. from a hand-edited
+        # file), so the mask is rebuilt from what is left
+        self.mask = 0
+        for route in self.routes():
+            self.mask |= get_route_mask(*route)
+
+    def discard(self, origin_index, dest_index):
+        """ Remove a ticket between origin_index and dest_index
+            Return True if there was such ticket.  Otherwise, return False.
+        """
+        with self.index.lock:
+            ids = self.index.routes.get((self.seat, origin_index, dest_index))
+            if ids is None:
+                return False
+            self._remove(ids[-1] if isinstance(ids, list) else ids)
+        self._changed()
+        return True
+
+    def discard_id(self, ticket_id):
+        """ Remove ticket ticket_id
+            Return True if this seat had such ticket.  Otherwise, return False.
+        """
+        with self.index.lock:
+            if self.index.tickets.get(ticket_id) is not self:
+                return False
+            self._remove(ticket_id)
+        self._changed()
+        return True
+
+    def routes(self):
+        return zip(self.origins, self.dests)
+
+    def append(self, ticket):
+        self.add(self.station_indexes[ticket['origin']],
+                 self.station_indexes[ticket['dest']])
+
+    def remove(self, ticket):
+        if not self.discard(self.station_indexes[ticket['origin']],
+                            self.station_indexes[ticket['dest']]):
+            raise ValueError("ticket is not in SeatTickets")
+
+    def clear(self):
+        with self.index.lock:
+            for k, ticket_id in enumerate(self.ids):
+                del self.index.tickets[ticket_id]
+                self.index.routes.pop((self.seat, self.origins[k],
+                                       self.dests[k]), None)
+            del self.origins[:]
+            del self.dests[:]
+            del self.ids[:]
+            self.mask = 0
+        self._changed()
+
+    def _ticket(self, k):
+        return {'origin': get_station_name(self.station_indexes,
+                                           self.origins[k]),
+                'dest': get_station_name(self.station_indexes,
+                                         self.dests[k])}
+
+    def __len__(self):
+        return len(self.origins)
+
+    def __iter__(self):
+        return (self._ticket(k) for k in range(len(self.origins)))
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self._ticket(i) for i in range(len(self.origins))[k]]
+        return self._ticket(range(len(self.origins))[k])
+
+    def __eq__(self, other):
+        if isinstance(other, SeatTickets):
+            return list(self) == list(other)
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def watch_seats(train_seats, watcher):
+    """ Make SeatTickets seats of train_seats call watcher.refresh(seat)
+        whenever the tickets of a seat change, so watcher can keep its own
+        index of the seats up to date
+
+        :param train_seats: dictionary of seats
+        :param watcher: object with method refresh(seat)
+        :return: nothing
+    """
+    seen = set()
+    for tickets in train_seats.values():
+        if isinstance(tickets, SeatTickets) and \
+                id(tickets.watchers) not in seen:
+            seen.add(id(tickets.watchers))
+            tickets.watchers.append(watcher)
+
+
+def get_ticket_routes(station_indexes, ticket_list):
+    """ Return (origin station index, dest station index) of each ticket in
+        ticket_list, without dictionary lookups for SeatTickets
+
+        :param station_indexes: dictionary of station indexes
+        :param ticket_list: list of tickets
+        :return: iterable of (int, int)
+        >>> list(get_ticket_routes({'AA': 0, 'BB': 1, 'CC': 2},\
+            [{'origin': 'AA', 'dest': 'BB'}, {'origin': 'BB', 'dest': 'CC'}]))
+        [(0, 1), (1, 2)]
+    """
+    if isinstance(ticket_list, SeatTickets):
+        return ticket_list.routes()
+    return [(station_indexes[j['origin']], station_indexes[j['dest']])
+            for j in ticket_list]
+
+
+def get_reserved_mask(station_indexes, ticket_list):
+    """ Return the reserved routes of all tickets in ticket_list as an
+        integer bitmask, the bitmask version of check_reserved_routes
+        The bitmask kept by SeatTickets is used when there is one.
+
+        :param station_indexes: dictionary of station indexes
+        :param ticket_list: list of tickets
+        :return: int
+        >>> bin(get_reserved_mask({'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4},\
+            [{'origin': 'AA', 'dest': 'BB'}, {'origin': 'DD', 'dest': 'EE'}]))
+        '0b11011'
+        >>> get_reserved_mask({'AA': 0, 'BB': 1}, [])
+        0
+    """
+    if isinstance(ticket_list, SeatTickets):
+        return ticket_list.mask
+    mask = 0
+    for j in ticket_list:
+        mask |= get_route_mask(station_indexes[j['origin']],
+                               station_indexes[j['dest']])
+    return mask
+
+
+def check_routes_available(station_indexes, ticket_list,
+                           origin_index, dest_index):
+    """ Return True if ticket with origin station index and dest station index \
+        is available on the seat with this ticket list.  Otherwise, return \
+        False.
+        Same result as is_ticket_available(check_reserved_routes(...), ...), \
+            but only a single AND of two bitmasks.
+
+        :param station_indexes: dictionary of station indexes
+        :param ticket_list: list of tickets
+        :param origin_index: int
+        :param dest_index: int
+        :return: boolean value
+        >>> check_routes_available({'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4}\
+        ,[{'origin': 'AA', 'dest': 'CC'}],3,4)
+        True
+        >>> check_routes_available({'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4}\
+        ,[{'origin': 'AA', 'dest': 'BB'}, {'origin': 'CC', 'dest': 'EE'}],1,3)
+        False
+        >>> check_routes_available({'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4}\
+        ,[{'origin': 'CC', 'dest': 'EE'}],0,1)
+        True
+    """
+    return not get_reserved_mask(station_indexes, ticket_list) & \
+        get_route_mask(origin_index, dest_index)
+
+
+class OccupancyMatrix:
+    """ Reserved routes of all seats of a train as a 2-D boolean matrix
+        (seats x stations), for finding all available seats at once with NumPy
+        Row r belongs to seat seats[r].  Value at (r, i) is True if station
+            index i is on any reserved ticket of that seat, the same as
+            check_reserved_routes.
+        SeatTickets seats keep the matrix up to date (see watch_seats).
+            For plain list seats, call refresh(seat) after the ticket list of
+            a seat is changed, and clear() after all tickets are cleared.
+        lock is held while the matrix is changed or searched.
+        main uses it for --batch --search matrix (see build_occupancy_matrix).
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        >>> indexes = StationIndexes({'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3})
+        >>> seats = {'1A': SeatTickets(indexes, [{'origin': 'AA', \
+            'dest': 'BB'}], seat='1A'), '1B': SeatTickets(indexes, \
+            [{'origin': 'CC', 'dest': 'DD'}], seat='1B'), \
+            '2A': SeatTickets(indexes, seat='2A')}
+        >>> matrix = build_occupancy_matrix(seats, indexes)
+        >>> seats['2A'].add(1, 2)
+        1
+        >>> matrix is None or all(matrix.available(i, j) == \
+            find_available_seats(seats, indexes, i, j, occupancy=None) \
+            for i in range(4) for j in range(i, 4))
+        True
+    """
+
+    def __init__(self, train_seats, station_indexes):
+        self.train_seats = train_seats
+        self.station_indexes = station_indexes
+        self.seats = list(train_seats.keys())
+        self.rows = {seat: r for r, seat in enumerate(self.seats)}
+        self.matrix = np.zeros((len(self.seats), len(station_indexes)),
+                               dtype=bool)
+        self.lock = threading.Lock()
+        for seat in self.seats:
+            self.refresh(seat)
+        watch_seats(train_seats, self)
+
+    def refresh(self, seat):
+        if seat not in self.rows:
+            return
+        with self.lock:
+            row = self.matrix[self.rows[seat]]
+            row[:] = False
+            for origin_index, dest_index in get_ticket_routes(
+                    self.station_indexes, self.train_seats[seat]):
+                row[origin_index:dest_index + 1] = True
+
+    def clear(self):
+        with self.lock:
+            self.matrix[:] = False
+
+    def available(self, origin_index, dest_index):
+        with self.lock:
+            free = ~self.matrix[:, origin_index:dest_index + 1].any(axis=1)
+        return [self.seats[r] for r in np.flatnonzero(free)]
+
+
+def build_occupancy_matrix(train_seats, station_indexes):
+    """ Return OccupancyMatrix of train_seats, or None if NumPy is not
+        installed
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :return: OccupancyMatrix or None
+    """
+    if import_numpy() is None:
+        return None
+    return OccupancyMatrix(train_seats, station_indexes)
+
+
+class AvailabilityCache:
+    """ Sets of available seats of the journeys asked so far
+        The first enquiry of a journey (origin_index, dest_index) checks every
+            seat (a miss); later ones return the kept set (a hit).  When the
+            tickets of one seat change, only that seat is checked again for
+            each kept journey, and it is put into or taken out of the set and
+            the list of the journey in seat order (bisect), so neither is
+            ever built again.
+        SeatTickets seats keep the cache up to date (see watch_seats).  For
+            plain list seats, call refresh(seat) after the ticket list of a
+            seat is changed, and clear() after all tickets are cleared.
+        hits and misses count enquiries.  lock is held while the sets are
+            changed or built.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        >>> seats = {'1A': [{'origin': 'AA', 'dest': 'BB'}], '1B': []}
+        >>> cache = AvailabilityCache(seats, {'AA': 0, 'BB': 1, 'CC': 2})
+        >>> cache.available(1, 2)
+        ['1B']
+        >>> seats['1B'].append({'origin': 'CC', 'dest': 'CC'})
+        >>> cache.refresh('1B')
+        >>> cache.available(1, 2), cache.available(0, 0)
+        ([], ['1B'])
+        >>> seats['1A'].clear()
+        >>> cache.refresh('1A')
+        >>> cache.available(0, 0), cache.counts(0, 0)
+        (['1A', '1B'], {1: 2})
+        >>> cache.hits, cache.misses
+        (3, 2)
+    """
+
+    def __init__(self, train_seats, station_indexes):
+        self.train_seats = train_seats
+        self.station_indexes = station_indexes
+        self.seats = list(train_seats)
+        self.positions = {seat: i for i, seat in enumerate(self.seats)}
+        self.masks = {seat: get_reserved_mask(station_indexes,
+                                              train_seats[seat])
+                      for seat in self.seats}
+        # (origin_index, dest_index): [route mask, set of seats, list of
+        #     seats in seat order, list of their positions in self.seats]
+        self.journeys = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        watch_seats(train_seats, self)
+
+    def refresh(self, seat):
+        if seat not in self.masks:
+            return
+        mask = get_reserved_mask(self.station_indexes, self.train_seats[seat])
+        with self.lock:
+            self.masks[seat] = mask
+            position = self.positions[seat]
+            for journey in self.journeys.values():
+                route, free, ordered, positions = journey
+                if mask & route:
+                    if seat in free:
+                        free.discard(seat)
+                        i = bisect_left(positions, position)
+                        del ordered[i], positions[i]
+                elif seat not in free:
+                    free.add(seat)
+                    i = bisect_left(positions, position)
+                    ordered.insert(i, seat)
+                    positions.insert(i, position)
+
+    def clear(self):
+        with self.lock:
+            for seat in self.seats:
+                self.masks[seat] = 0
+            for journey in self.journeys.values():
+                journey[1:] = [set(self.seats), list(self.seats),
+                               list(range(len(self.seats)))]
+
+    def free(self, origin_index, dest_index):
+        """ Return the set of available seats (do not change it)
+        """
+        return self._journey(origin_index, dest_index)[1]
+
+    def available(self, origin_index, dest_index):
+        """ Return the list of available seats in seat order (do not change
+            it; it is kept up to date)
+        """
+        return self._journey(origin_index, dest_index)[2]
+
+    def counts(self, origin_index, dest_index):
+        """ Return a dictionary of seat class: number of available seats
+            (classes without available seats are left out)
+        """
+        journey = self._journey(origin_index, dest_index)
+        counts = {}
+        with self.lock:
+            for seat in journey[2]:
+                seat_class = int(seat[0])
+                counts[seat_class] = counts.get(seat_class, 0) + 1
+        return counts
+
+    def _journey(self, origin_index, dest_index):
+        journey = self.journeys.get((origin_index, dest_index))
+        if journey is not None:
+            self.hits += 1
+            return journey
+        self.misses += 1
+        route = get_route_mask(origin_index, dest_index)
+        with self.lock:
+            positions = [i for i, seat in enumerate(self.seats)
+                         if not self.masks[seat] & route]
+            ordered = [self.seats[i] for i in positions]
+            journey = [route, set(ordered), ordered, positions]
+            self.journeys[origin_index, dest_index] = journey
+        return journey
+
+    def stats(self):
+        """ Return a dictionary of 'hits', 'misses' and 'journeys' (number of
+            kept journeys)
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'journeys': len(self.journeys)}
+
+
+def find_available_seats(train_seats, station_indexes, origin_index,
+                         dest_index, occupancy=None):
+    """ Return a list of seats where ticket between origin station index and \
+        dest station index is available
+        Use occupancy (OccupancyMatrix, SeatFinder or AvailabilityCache) if \
+            given, otherwise check each seat with check_routes_available. \
+            All give the same list.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param origin_index: int
+        :param dest_index: int
+        :param occupancy: OccupancyMatrix, SeatFinder, AvailabilityCache or
+            None
+        :return: list of strings
+        >>> find_available_seats({'1A': [{'origin': 'AA', 'dest': 'BB'}],\
+            '1B': [{'origin': 'DD', 'dest': 'EE'}], '2A': []},\
+            {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4}, 1, 2)
+        ['1B', '2A']
+        >>> find_available_seats({'1A': [{'origin': 'AA', 'dest': 'BB'}],\
+            '1B': [{'origin': 'DD', 'dest': 'EE'}], '2A': []},\
+            {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4}, 2, 3)
+        ['1A', '2A']
+    """
+    if occupancy is not None:
+        return occupancy.available(origin_index, dest_index)
+    return [i for i in train_seats.keys() if check_routes_available(
+        station_indexes, train_seats[i], origin_index, dest_index)]
+
+
+class SeatFinder:
+    """ Segment tree over the seats of a train, for finding free seats \
+        without checking every seat
+        Each node keeps the AND and the OR of the reserved route bitmasks
+            (see get_reserved_mask) of the seats under it.  A journey that
+            hits the AND is reserved on every seat under the node, so the
+            node is skipped; a journey that misses the OR is free on every
+            seat under the node, so all of them are taken at once.
+        There is one tree for all seats and one for each seat class, so
+            seat_class can be given to every query.
+        Only first_seat and free_seats with k skip parts of the train;
+            best_fit_seat compares the gap of every free seat, so it takes
+            time in proportion to the number of free seats.
+        SeatTickets seats keep the trees up to date (see watch_seats).  For
+            plain list seats, call refresh(seat) after a change.
+        lock is held while the trees are changed.  Hold it while searching
+            if other threads change seats at the same time.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        >>> finder = SeatFinder({'1A': [{'origin': 'AA', 'dest': 'CC'}], \
+            '1B': [], '2A': [{'origin': 'CC', 'dest': 'DD'}], '2B': []}, \
+            {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4})
+        >>> finder.free_seats(3, 4)
+        ['1A', '1B', '2B']
+        >>> finder.free_seats(3, 4, 1, 2)
+        ['2B']
+        >>> finder.first_seat(0, 1)
+        '1B'
+        >>> finder.best_fit_seat(0, 1)
+        '2A'
+    """
+
+    def __init__(self, train_seats, station_indexes):
+        self.train_seats = train_seats
+        self.station_indexes = station_indexes
+        self.num_stations = len(station_indexes)
+        self.lock = threading.Lock()
+        seat_classes = {}
+        for seat in train_seats:
+            seat_classes.setdefault(int(seat[0]), []).append(seat)
+        self.trees = {None: self._build(list(train_seats))}
+        for seat_class, seats in seat_classes.items():
+            self.trees[seat_class] = self._build(seats)
+        watch_seats(train_seats, self)
+
+    def _build(self, seats):
+        size = 1
+        while size < len(seats):
+            size *= 2
+        all_masks = [-1] * (2 * size)
+        any_masks = [-1] * (2 * size)
+        for k, seat in enumerate(seats):
+            mask = get_reserved_mask(self.station_indexes,
+                                     self.train_seats[seat])
+            all_masks[size + k] = any_masks[size + k] = mask
+        for n in range(size - 1, 0, -1):
+            all_masks[n] = all_masks[2 * n] & all_masks[2 * n + 1]
+            any_masks[n] = any_masks[2 * n] | any_masks[2 * n + 1]
+        return {'seats': seats, 'size': size, 'all': all_masks,
+                'any': any_masks,
+                'positions': {seat: k for k, seat in enumerate(seats)}}
+
+    def refresh(self, seat):
+        mask = get_reserved_mask(self.station_indexes, self.train_seats[seat])
+        with self.lock:
+            for tree in (self.trees[None], self.trees.get(int(seat[0]))):
+                if tree is None or seat not in tree['positions']:
+                    continue
+                all_masks = tree['all']
+                any_masks = tree['any']
+                n = tree['size'] + tree['positions'][seat]
+                all_masks[n] = any_masks[n] = mask
+                n //= 2
+                while n:
+                    all_masks[n] = all_masks[2 * n] & all_masks[2 * n + 1]
+                    any_masks[n] = any_masks[2 * n] | any_masks[2 * n + 1]
+                    n //= 2
+
+    def clear(self):
+        for seat in self.train_seats:
+            self.refresh(seat)
+
+    def _iter_free(self, route, seat_class):
+        tree = self.trees.get(seat_class)
+        if tree is None:
+            return
+        seats = tree['seats']
+        all_masks = tree['all']
+        any_masks = tree['any']
+        size = tree['size']
+        stack = [1]
+        while stack:
+            n = stack.pop()
+            if all_masks[n] & route:
+                continue
+            if not any_masks[n] & route:
+                level = n.bit_length() - 1
+                width = size >> level
+                low = (n - (1 << level)) * width
+                yield from seats[low:low + width]
+                continue
+            stack.append(2 * n + 1)
+            stack.append(2 * n)
+
+    def iter_free_seats(self, origin_index, dest_index, seat_class=None):
+        """ Yield seats where ticket between origin_index and dest_index is
+            available, in seat order
+        """
+        return self._iter_free(get_route_mask(origin_index, dest_index),
+                               seat_class)
+
+    def free_seats(self, origin_index, dest_index, k=None, seat_class=None):
+        """ Return a list of the first k seats (all if k is None) where
+            ticket between origin_index and dest_index is available
+        """
+        route = get_route_mask(origin_index, dest_index)
+        result = []
+        for seat in self._iter_free(route, seat_class):
+            if k is not None and len(result) >= k:
+                break
+            result.append(seat)
+        return result
+
+    def available(self, origin_index, dest_index):
+        return self.free_seats(origin_index, dest_index)
+
+    def first_seat(self, origin_index, dest_index, seat_class=None):
+        """ Return the first available seat, or None
+        """
+        seats = self.free_seats(origin_index, dest_index, 1, seat_class)
+        return seats[0] if seats else None
+
+    def best_fit_seat(self, origin_index, dest_index, seat_class=None):
+        """ Return the available seat whose free stations around the journey
+            are fewest (see get_free_gap), or None.  The first such seat is
+            returned if several seats fit equally well.
+        The trees only skip reserved seats: every free seat is checked,
+            unless one fits exactly.
+        """
+        route = get_route_mask(origin_index, dest_index)
+        best = None
+        best_gap = None
+        for seat in self._iter_free(route, seat_class):
+            gap = get_free_gap(get_reserved_mask(self.station_indexes,
+                                                 self.train_seats[seat]),
+                               origin_index, dest_index, self.num_stations)
+            if best_gap is None or gap < best_gap:
+                best = seat
+                best_gap = gap
+                if gap == 0:
+                    break
+        return best
+
+
+def get_free_gap(reserved_mask, origin_index, dest_index, num_stations):
+    """ Return the number of free stations that are left next to a new ticket
+        between origin_index and dest_index on a seat with reserved routes
+        reserved_mask, inside the free run of stations around the ticket
+        0 means the ticket exactly fills a free run.
+
+        :param reserved_mask: int
+        :param origin_index: int
+        :param dest_index: int
+        :param num_stations: int
+        :return: int
+        >>> get_free_gap(0b0000011, 2, 4, 7)
+        2
+        >>> get_free_gap(0b1100011, 2, 4, 7)
+        0
+        >>> get_free_gap(0, 0, 1, 7)
+        5
+    """
+    low = (reserved_mask & ((1 << origin_index) - 1)).bit_length()
+    above = reserved_mask >> (dest_index + 1)
+    if above:
+        high = dest_index + 1 + ((above & -above).bit_length() - 1)
+    else:
+        high = num_stations
+    return (high - low) - (dest_index - origin_index + 1)
+
+
+def iter_available_seats(train_seats, station_indexes, origin_index,
+                         dest_index, seat_class=None, occupancy=None):
+    """ Yield available seats (of seat_class if given) in seat order, using
+        occupancy (OccupancyMatrix or SeatFinder) if given
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param origin_index: int
+        :param dest_index: int
+        :param seat_class: int or None
+        :param occupancy: OccupancyMatrix, SeatFinder or None
+        :return: iterator of strings
+    """
+    if isinstance(occupancy, SeatFinder):
+        yield from occupancy.iter_free_seats(origin_index, dest_index,
+                                             seat_class)
+        return
+    if occupancy is not None:
+        seats = occupancy.available(origin_index, dest_index)
+    else:
+        seats = (i for i in train_seats if check_routes_available(
+            station_indexes, train_seats[i], origin_index, dest_index))
+    for i in seats:
+        if seat_class is None or int(i[0]) == seat_class:
+            yield i
+
+
+def first_fit(train_seats, station_indexes, origin_index, dest_index,
+              seat_class=None, occupancy=None):
+    """ Allocation strategy: return the first available seat (of seat_class
+        if given), or None if there is no available seat
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param origin_index: int
+        :param dest_index: int
+        :param seat_class: int or None
+        :param occupancy: OccupancyMatrix, SeatFinder or None
+        :return: string or None
+        >>> first_fit({'1A': [{'origin': 'AA', 'dest': 'BB'}], '1B': [], \
+            '2A': [{'origin': 'DD', 'dest': 'EE'}]}, \
+            {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4}, 0, 1)
+        '1B'
+        >>> first_fit({'1A': [], '2A': []}, {'AA': 0, 'BB': 1}, 0, 1, 2)
+        '2A'
+    """
+    return next(iter_available_seats(train_seats, station_indexes,
+                                     origin_index, dest_index, seat_class,
+                                     occupancy), None)
+
+
+def best_fit(train_seats, station_indexes, origin_index, dest_index,
+             seat_class=None, occupancy=None):
+    """ Allocation strategy: return the available seat (of seat_class if
+        given) that leaves the fewest free stations next to the new ticket
+        (see get_free_gap), or None if there is no available seat
+        Short journeys go into gaps that are already short, which keeps long
+            free runs for long journeys.  The first seat wins a tie.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param origin_index: int
+        :param dest_index: int
+        :param seat_class: int or None
+        :param occupancy: OccupancyMatrix, SeatFinder or None
+        :return: string or None
+        >>> best_fit({'1A': [{'origin': 'AA', 'dest': 'BB'}], '1B': [], \
+            '2A': [{'origin': 'DD', 'dest': 'EE'}]}, \
+            {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4}, 0, 1)
+        '2A'
+    """
+    if isinstance(occupancy, SeatFinder):
+        return occupancy.best_fit_seat(origin_index, dest_index, seat_class)
+    best = None
+    best_gap = None
+    for i in iter_available_seats(train_seats, station_indexes, origin_index,
+                                  dest_index, seat_class, occupancy):
+        gap = get_free_gap(get_reserved_mask(station_indexes, train_seats[i]),
+                           origin_index, dest_index, len(station_indexes))
+        if best_gap is None or gap < best_gap:
+            best = i
+            best_gap = gap
+            if gap == 0:
+                break
+    return best
+
+
+def class_aware_fit(train_seats, station_indexes, origin_index, dest_index,
+                    seat_class=None, occupancy=None):
+    """ Allocation strategy: best_fit in seat_class; if that class has no
+        available seat (or seat_class is None), best_fit in the other
+        classes, nearest class first (for class 2: 1, 3, ...)
+        Return None if no class has an available seat.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param origin_index: int
+        :param dest_index: int
+        :param seat_class: int or None
+        :param occupancy: OccupancyMatrix, SeatFinder or None
+        :return: string or None
+        >>> class_aware_fit({'1A': [], '2A': [{'origin': 'AA', \
+            'dest': 'BB'}], '3A': []}, {'AA': 0, 'BB': 1, 'CC': 2}, 0, 1, 2)
+        '1A'
+    """
+    if seat_class is None:
+        return best_fit(train_seats, station_indexes, origin_index,
+                        dest_index, None, occupancy)
+    seat_classes = sorted({int(i[0]) for i in train_seats},
+                          key=lambda c: (abs(c - seat_class), c))
+    for c in seat_classes:
+        seat = best_fit(train_seats, station_indexes, origin_index,
+                        dest_index, c, occupancy)
+        if seat is not None:
+            return seat
+    return None
+
+
+# name: allocation strategy, see first_fit
+ALLOCATION_STRATEGIES = {
+    'first_fit': first_fit,
+    'best_fit': best_fit,
+    'class_aware': class_aware_fit,
+}
+
+
 def choose_available_seat(available_seats):
     """ Read available seat from user
         Receive a list of available seats (e.g., ['1A', '1B', '1C'])
@@ -243,42 +1946,68 @@ def choose_available_seat(available_seats):
         print(f"Available seats: {available_seats}")
 
 
-def update_seat(station_indexes, origin_index, dest_index, ticket_list):
+def update_seat(station_indexes, origin_index, dest_index, ticket_list,
+                journal=None, seat=None):
     """ Add new ticket to the ticket list of one seat
         Receive dictionary of station indexes, origin station index (int), \
             dest station index (int) and ticket list of one specific seat as \
             function inputs
         This function is called after the program finds out ticket between \
             origin station index and dest station index is available.
-        Return the updated ticket list
+        If journal is given, the ticket is also recorded there as reserved
+            on seat, with journal.lock held over both.
+        Return the ticket id (see TicketIndex) of the new ticket, or None for
+            a plain list ticket list
 
         :param station_indexes: dictionary of station indexes
         :param origin_index: int
         :param dest_index: int
         :param ticket_list: list of ticket from one seat
-        :return: ticket list
+        :param journal: TicketJournal or None
+        :param seat: string (with journal)
+        :return: int or None
+        >>> tickets = [{'origin': 'AA', 'dest': 'BB'}]
         >>> update_seat(\
             {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4},\
-             2, 3, \
-            [{'origin': 'AA', 'dest': 'BB'}])
+             2, 3, tickets)
+        >>> tickets
         [{'origin': 'AA', 'dest': 'BB'}, {'origin': 'CC', 'dest': 'DD'}]
 
+        >>> tickets = [{'origin': 'AA', 'dest': 'BB'}, \
+            {'origin': 'FF', 'dest': 'GG'}]
         >>> update_seat(\
             {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4, 'FF': 5, 'GG': 6}, \
-            3, 4, \
-            [{'origin': 'AA', 'dest': 'BB'}, {'origin': 'FF', 'dest': 'GG'}])
+            3, 4, tickets)
+        >>> tickets
         [{'origin': 'AA', 'dest': 'BB'}, {'origin': 'FF', 'dest': 'GG'}, {'origin': 'DD', 'dest': 'EE'}]
 
-        >>> update_seat(\
-        {   'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4},\
-            0, 1, \
-            [{'origin': 'DD', 'dest': 'EE'}])
+        >>> tickets = SeatTickets(StationIndexes(\
+            {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3, 'EE': 4}), \
+            [{'origin': 'DD', 'dest': 'EE'}], seat='1A')
+        >>> update_seat(tickets.station_indexes, 0, 1, tickets)
+        2
+        >>> tickets
         [{'origin': 'DD', 'dest': 'EE'}, {'origin': 'AA', 'dest': 'BB'}]
     """
+    if journal is None:
+        return _add_ticket(station_indexes, origin_index, dest_index,
+                           ticket_list)
+    with journal.lock:
+        ticket_id = _add_ticket(station_indexes, origin_index, dest_index,
+                                ticket_list)
+        journal.reserve(seat, get_station_name(station_indexes, origin_index),
+                        get_station_name(station_indexes, dest_index),
+                        ticket_id)
+    return ticket_id
+
+
+def _add_ticket(station_indexes, origin_index, dest_index, ticket_list):
+    if isinstance(ticket_list, SeatTickets):
+        return ticket_list.add(origin_index, dest_index)
     ticket_list.append(
         {'origin': get_station_name(station_indexes, origin_index),
          'dest': get_station_name(station_indexes, dest_index)})
-    return ticket_list
+    return None
 
 
 def get_ticket_price(station_indexes, station_fees, origin_index, dest_index,
@@ -314,12 +2043,68 @@ def get_ticket_price(station_indexes, station_fees, origin_index, dest_index,
         50
     """
     seat_class -= 1
+    fares = getattr(station_fees, 'fares', None)
+    if fares is not None:
+        return fares[seat_class][dest_index] - fares[seat_class][origin_index]
     origin = get_station_name(station_indexes, origin_index)
     dest = get_station_name(station_indexes, dest_index)
     return station_fees[dest][seat_class] - station_fees[origin][seat_class]
 
 
-def reserve(train_seats, train_seat_classes, station_indexes, station_fees):
+def get_ticket_prices(station_indexes, station_fees, origin_index,
+                      dest_index):
+    """ Return a list of ticket prices of all classes between origin station
+            index and dest station index.  First member = Ticket price of
+            class 1, ..., Last member = Ticket price of class n.
+        Use the fare matrix of StationFees when there is one.
+
+        :param station_indexes: dictionary of station indexes
+        :param station_fees: dictionary of ticket fees
+        :param origin_index: int
+        :param dest_index: int
+        :return: list of ints
+        >>> get_ticket_prices({'AA': 0, 'BB': 1, 'CC': 2}, \
+            {'AA': [0, 0], 'BB': [200, 100], 'CC': [275, 150]}, 1, 2)
+        [75, 50]
+    """
+    matrix = getattr(station_fees, 'matrix', None)
+    if matrix is not None:
+        return matrix[origin_index][dest_index]
+    num_classes = len(next(iter(station_fees.values())))
+    return [get_ticket_price(station_indexes, station_fees, origin_index,
+                             dest_index, c) for c in range(1, num_classes + 1)]
+
+
+def get_manifest_prices(train_seats, station_indexes, station_fees):
+    """ Return ticket prices of all reserved tickets in one call
+        Return a dictionary where key is seat, and value is a list of ticket
+            prices, one for each ticket of the seat in the same order.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param station_fees: dictionary of ticket fees
+        :return: dictionary of lists of ints
+        >>> get_manifest_prices({'1A': [{'origin': 'AA', 'dest': 'BB'}, \
+            {'origin': 'BB', 'dest': 'CC'}], '2A': [{'origin': 'AA', \
+            'dest': 'CC'}]}, {'AA': 0, 'BB': 1, 'CC': 2}, \
+            {'AA': [0, 0], 'BB': [200, 100], 'CC': [275, 150]})
+        {'1A': [200, 75], '2A': [150]}
+    """
+    fares = getattr(station_fees, 'fares', None)
+    prices = {}
+    for i in train_seats:
+        routes = get_ticket_routes(station_indexes, train_seats[i])
+        if fares is not None:
+            class_fares = fares[int(i[0]) - 1]
+            prices[i] = [class_fares[d] - class_fares[o] for o, d in routes]
+        else:
+            prices[i] = [get_ticket_price(station_indexes, station_fees, o, d,
+                                          int(i[0])) for o, d in routes]
+    return prices
+
+
+def reserve(train_seats, train_seat_classes, station_indexes, station_fees,
+            occupancy=None, journal=None):
     """ Function reserve does the followings:
         1. read origin and destination station indexes from user
         2. find available seats between origin and destination station indexes
@@ -334,30 +2119,31 @@ def reserve(train_seats, train_seat_classes, station_indexes, station_fees):
         :param train_seat_classes: list of seat classes
         :param station_indexes: dictionary of station indexes
         :param station_fees: dictionary of ticket fees
+        :param occupancy: OccupancyMatrix, SeatFinder, AvailabilityCache or
+            None
+        :param journal: TicketJournal or None
         :return: nothing
     """
-    origin_index = read_origin()
-    dest_index = read_dest(origin_index)
+    origin_index = read_origin(station_indexes)
+    dest_index = read_dest(origin_index, station_indexes)
 
-    available = [i for i in train_seats.keys() if is_ticket_available(
-        check_reserved_routes(station_indexes, train_seats[i]), origin_index,
-        dest_index) is True]
+    available = find_available_seats(train_seats, station_indexes,
+                                     origin_index, dest_index, occupancy)
 
     if not available:
         print("Sorry. No available seat.")
 
     else:
         print(f"Available seats: {available}")
-        price = [get_ticket_price(station_indexes, station_fees, origin_index,
-                                  dest_index, i)
-                 for i in train_seat_classes]
+        price = get_ticket_prices(station_indexes, station_fees, origin_index,
+                                  dest_index)
         [print(f"Class {i} Ticket price = {price[i - 1]}") for i in
          train_seat_classes]
         seat = choose_available_seat(available)
         print(f"The selected seat = {seat}")
         print(f"The ticket price = {price[int(seat[0]) - 1]}")
-        train_seats[seat] = update_seat(station_indexes, origin_index,
-                                        dest_index, train_seats[seat])
+        update_seat(station_indexes, origin_index, dest_index,
+                    train_seats[seat], journal, seat)
 
 
 def read_canceled_seat(train_seats):
@@ -398,6 +2184,8 @@ def remove_ticket(train_seats, station_indexes, seat_str, origin_index,
         :param dest_index: int
         :return: boolean value
     """
+    if isinstance(train_seats[seat_str], SeatTickets):
+        return train_seats[seat_str].discard(origin_index, dest_index)
     for j in train_seats[seat_str]:
         if station_indexes[j['origin']] == origin_index and \
                 station_indexes[j['dest']] == dest_index:
@@ -406,7 +2194,7 @@ def remove_ticket(train_seats, station_indexes, seat_str, origin_index,
     return False
 
 
-def cancel(train_seats, station_indexes):
+def cancel(train_seats, station_indexes, journal=None):
     """ Function cancel does the followings:
         1. read the canceled seat from user
         2. read the origin and destination station index of canceled ticket
@@ -418,113 +2206,1357 @@ def cancel(train_seats, station_indexes):
 
         :param train_seats: dictionary of seats
         :param station_indexes: dictionary of station indexes
+        :param journal: TicketJournal or None
         :return: nothing
     """
     print(f"Seats are {[i for i in train_seats.keys()]}")
     seat_str = read_canceled_seat(train_seats)
-    origin_index = read_origin()
-    dest_index = read_dest(origin_index)
+    origin_index = read_origin(station_indexes)
+    dest_index = read_dest(origin_index, station_indexes)
 
-    text = f"Tickets issued at {seat_str}:"
-    for j in train_seats[seat_str]:
-        origin = j['origin']
-        origin_number = get_station_index(station_indexes, origin)
-        dest = j['dest']
-        dest_number = get_station_index(station_indexes, dest)
-        text += f" [{origin}({origin_number})-{dest}({dest_number})],"
-    print(text)
+    print(f"Tickets issued at {seat_str}:"
+          f"{format_tickets(station_indexes, train_seats[seat_str])}")
 
     if remove_ticket(train_seats, station_indexes, seat_str,
                      origin_index, dest_index):
-        print("After cancellation:")
-        text = f"Tickets issued at {seat_str}:"
-        for j in train_seats[seat_str]:
-            origin = j['origin']
-            origin_number = get_station_index(station_indexes, origin)
-            dest = j['dest']
-            dest_number = get_station_index(station_indexes, dest)
-            text += f" [{origin}({origin_number})-{dest}({dest_number})],"
-        print(text)
+        if journal is not None:
+            journal.cancel(seat_str,
+                           get_station_name(station_indexes, origin_index),
+                           get_station_name(station_indexes, dest_index))
+        print("After cancellation:\n"
+              f"Tickets issued at {seat_str}:"
+              f"{format_tickets(station_indexes, train_seats[seat_str])}")
 
     else:
         print(f"Ticket does not exist at {seat_str}")
 
 
-def show_ticket_prices(train_seats, station_indexes, station_fees):
+def show_ticket_prices(train_seats, station_indexes, station_fees,
+                       seat_names=None, seat_class=None, page=None,
+                       page_size=50, file=None):
     """ Display reserved tickets from all seats, along with TICKET PRICE
         Use information of ticket list inside each seat from dictionary of
             seats, dictionary of station indexes, and diction of ticket fees
             to help display.
+        Only seats chosen by select_seats are shown.  The whole text is
+            built first and written at once.
 
         :param train_seats: dictionary of seats
         :param station_indexes: dictionary of station indexes
         :param station_fees: dictionary of ticket fees
+        :param seat_names: list of strings or None
+        :param seat_class: int or None
+        :param page: int or None
+        :param page_size: int
+        :param file: file object or None for standard output
         :return: nothing
+        >>> show_ticket_prices({'1A': [{'origin': 'AA', 'dest': 'BB'}], \
+            '2A': [{'origin': 'AA', 'dest': 'BB'}]}, {'AA': 0, 'BB': 1}, \
+            {'AA': [0, 0], 'BB': [200, 100]}, seat_class=2)
+        2A: [AA(0)-BB(1)-100],
     """
+    selected = select_seats(train_seats, seat_names, seat_class, page,
+                            page_size)
+    prices = get_manifest_prices({i: train_seats[i] for i in selected},
+                                 station_indexes, station_fees)
+    names = get_station_names(station_indexes)
+    text = "".join(f"{i}:" + format_tickets(station_indexes, train_seats[i],
+                                            prices[i], names) + "\n"
+                   for i in selected)
+    (sys.stdout if file is None else file).write(text)
+
+
+def get_load_counts(train_seats, station_indexes):
+    """ Count occupied seats on every station for each seat class, in one
+        pass over all seats
+        The reserved stations of a seat (see get_reserved_mask) are split
+            into runs of consecutive stations, and each run adds 1 at its
+            first station and -1 after its last in a difference list of its
+            seat class; running sums give the counts.  A seat is counted once
+            on a station even if its tickets share that station (e.g. from a
+            hand-edited file), so the load never goes over 100%.
+        Return a dictionary where key is seat class (None for all seats), and
+            value is a list of occupied seat counts, one for each station
+            index.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :return: dictionary of lists of ints
+        >>> get_load_counts({'1A': [{'origin': 'AA', 'dest': 'BB'}], \
+            '1B': [{'origin': 'BB', 'dest': 'CC'}], \
+            '2A': [{'origin': 'AA', 'dest': 'CC'}]}, \
+            {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3})
+        {1: [1, 2, 1, 0], 2: [1, 1, 1, 0], None: [2, 3, 2, 0]}
+        >>> get_load_counts({'1A': [{'origin': 'AA', 'dest': 'CC'}, \
+            {'origin': 'BB', 'dest': 'CC'}, {'origin': 'DD', 'dest': 'DD'}]}, \
+            {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3})
+        {1: [1, 1, 1, 1], None: [1, 1, 1, 1]}
+    """
+    num_stations = len(station_indexes)
+    diffs = {}
+    for i in train_seats:
+        diff = diffs.get(int(i[0]))
+        if diff is None:
+            diff = diffs[int(i[0])] = [0] * (num_stations + 1)
+        mask = get_reserved_mask(station_indexes, train_seats[i])
+        while mask:
+            low = mask & -mask
+            after = mask + low  # clears the lowest run and sets the bit after
+            diff[low.bit_length() - 1] += 1
+            diff[(after & -after).bit_length() - 1] -= 1
+            mask &= after
+    counts = {c: list(accumulate(diffs[c][:-1])) for c in sorted(diffs)}
+    counts[None] = [sum(x) for x in zip(*counts.values())] \
+        if counts else [0] * num_stations
+    return counts
+
+
+def show_load_report(train_seats, station_indexes, report_format='table',
+                     file=None):
+    """ Display occupied seats and load factor (occupied / all seats, in
+        percent) on every station for each seat class and for all seats
+        report_format is 'table' or 'csv'.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param report_format: string
+        :param file: file object or None for standard output
+        :return: nothing
+        >>> show_load_report({'1A': [{'origin': 'AA', 'dest': 'BB'}], \
+            '1B': [], '2A': [{'origin': 'BB', 'dest': 'CC'}]}, \
+            StationIndexes({'AA': 0, 'BB': 1, 'CC': 2}))
+          # station               class 1     %  class 2     %      all     %
+          0 AA                        1/2  50.0      0/1   0.0      1/3  33.3
+          1 BB                        1/2  50.0      1/1 100.0      2/3  66.7
+          2 CC                        0/2   0.0      1/1 100.0      1/3  33.3
+        >>> show_load_report({'1A': [{'origin': 'AA', 'dest': 'BB'}]}, \
+            StationIndexes({'AA': 0, 'BB': 1}), 'csv', sys.stdout)
+        index,station,class_1_occupied,class_1_seats,class_1_load
+        0,AA,1,1,100.0
+        1,BB,1,1,100.0
+    """
+    file = sys.stdout if file is None else file
+    counts = get_load_counts(train_seats, station_indexes)
+    seats = {c: 0 for c in counts}
     for i in train_seats:
-        text = f"{i}:"
-        for j in train_seats[i]:
-            origin = j['origin']
-            origin_index = get_station_index(station_indexes, origin)
-            dest = j['dest']
-            dest_index = get_station_index(station_indexes, dest)
-            price = get_ticket_price(station_indexes, station_fees,
-                                     origin_index, dest_index, int(i[0]))
-            text += f" [{origin}({origin_index})-{dest}({dest_index})" \
-                    f"-{price}],"
-        print(text)
-
-
-def clear_tickets(train_seats):
+        seats[int(i[0])] += 1
+        seats[None] += 1
+    classes = [c for c in counts if c is not None]
+    if len(classes) > 1:
+        classes.append(None)
+    names = [f"class_{c}" if c is not None else 'all' for c in classes]
+
+    if report_format == 'csv':
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(['index', 'station'] + [
+            f"{name}_{x}" for name in names
+            for x in ('occupied', 'seats', 'load')])
+        for k in range(len(station_indexes)):
+            writer.writerow([k, get_station_name(station_indexes, k)] + [
+                x for c in classes for x in (
+                    counts[c][k], seats[c],
+                    round(100 * counts[c][k] / seats[c], 1))])
+        return
+
+    print(f"{'#':>3} {'station':<20}" + "".join(
+        f"{name.replace('_', ' '):>9}{'%':>6}" for name in names), file=file)
+    for k in range(len(station_indexes)):
+        print(f"{k:>3} {get_station_name(station_indexes, k):<20}" + "".join(
+            f"{f'{counts[c][k]}/{seats[c]}':>9}"
+            f"{100 * counts[c][k] / seats[c]:>6.1f}" for c in classes),
+            file=file)
+
+
+def clear_tickets(train_seats, station_indexes, journal=None):
     """ Set ticket list of each seat to be empty list
 
         :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param journal: TicketJournal or None
         :return: nothing
     """
     print("After clearing all tickets")
     for i in train_seats.keys():
         train_seats[i].clear()
+    if journal is not None:
+        journal.clear()
     show_seats(train_seats, station_indexes)
 
 
-station_fees, station_indexes = read_stations('south_stations.txt')
-# print(station_fees)        # you can uncomment this line to see output
-# print(station_indexes)     # you can uncomment this line to see output
-TOTAL_NUM_STATIONS = len(station_indexes)
-# print(TOTAL_NUM_STATIONS)  # you can uncomment this line to see output
-
-train_seats, train_seat_classes = read_seats('south_train_seats.txt')
-# print(train_seats)         # you can uncomment this line to see output
-# print(train_seat_classes)  # you can uncomment this line to see output
-
-read_reserved_tickets('south_reserved_tickets.txt', train_seats)
-# print(train_seats)  # you can uncomment this line to see output
-
-while True:
-    print()
-    print('1. Show seats')
-    print('2. Reserve ticket')
-    print('3. Cancel ticket')
-    print('4. Show ticket prices')
-    print('5. Clear all tickets')
-    print('6. Exit')
-    choice = int(input('Enter your choice: '))
-    if choice == 1:
-        show_seats(train_seats, station_indexes)
-    elif choice == 2:
-        reserve(train_seats, train_seat_classes, station_indexes, station_fees)
-    elif choice == 3:
-        cancel(train_seats, station_indexes)
-    elif choice == 4:
-        show_ticket_prices(train_seats, station_indexes, station_fees)
-    elif choice == 5:
-        clear_tickets(train_seats)
-    elif choice == 6:
-        break
+def read_request_station(station_indexes, station):
+    """ Return station index of a station given in a batch request, either \
+        as station index (int) or as station name (string)
+        Return None if there is no such station.
+
+        :param station_indexes: dictionary of station indexes
+        :param station: int or string
+        :return: int or None
+        >>> read_request_station({'AA': 0, 'BB': 1, 'CC': 2}, 'BB')
+        1
+        >>> read_request_station({'AA': 0, 'BB': 1, 'CC': 2}, 2)
+        2
+        >>> read_request_station({'AA': 0, 'BB': 1, 'CC': 2}, 3) is None
+        True
+        >>> read_request_station({'AA': 0, 'BB': 1, 'CC': 2}, ['AA']) is None
+        True
+    """
+    if isinstance(station, bool):
+        return None
+    if isinstance(station, int):
+        if 0 <= station < len(station_indexes):
+            return station
+        return None
+    if not isinstance(station, str):
+        return None
+    return station_indexes.get(station)
+
+
+def get_ticket_index(train_seats):
+    """ Return the TicketIndex shared by SeatTickets seats of train_seats, or
+        None for plain list seats
+
+        :param train_seats: dictionary of seats
+        :return: TicketIndex or None
+    """
+    for tickets in train_seats.values():
+        return tickets.index if isinstance(tickets, SeatTickets) else None
+    return None
+
+
+def process_request(request, train_seats, station_indexes, station_fees,
+                    occupancy=None, journal=None, strategy='first_fit'):
+    """ Apply one batch request to train_seats without asking the user
+        request is a dictionary with key 'action' and
+            'reserve': 'origin', 'dest', and optional 'seat' or 'class'
+                (int).
+                The requested seat, or else the seat chosen by allocation
+                strategy (see ALLOCATION_STRATEGIES) for the requested
+                class, is reserved.
+            'cancel': 'seat', 'origin' and 'dest' of the canceled ticket,
+                or 'ticket', its ticket id (SeatTickets seats only).
+        origin and dest are station indexes or station names.  A field of
+            the wrong type (e.g. a list as seat) is rejected like a wrong
+            value, so one bad request never stops a batch.
+        If request has key 'id', it is copied to the result.
+        Return a result dictionary with 'status' 'reserved' (with 'seat'
+            and 'price', and 'ticket' for SeatTickets seats), 'canceled'
+            (with 'seat'; with 'ticket' and 'refund', the ticket price, when
+            canceled by ticket id) or 'rejected' (with 'reason').
+
+        :param request: dictionary
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param station_fees: dictionary of ticket fees
+        :param occupancy: OccupancyMatrix, SeatFinder or None
+        :param journal: TicketJournal or None
+        :param strategy: string
+        :return: dictionary
+        >>> seats = {'1A': [{'origin': 'AA', 'dest': 'BB'}], '2A': []}
+        >>> indexes = {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3}
+        >>> fees = {'AA': [0, 0], 'BB': [200, 100], 'CC': [275, 150], \
+            'DD': [300, 200]}
+        >>> process_request({'id': 1, 'action': 'reserve', 'origin': 'CC',\
+            'dest': 'DD'}, seats, indexes, fees)
+        {'id': 1, 'status': 'reserved', 'seat': '1A', 'price': 25}
+        >>> process_request({'action': 'reserve', 'origin': 0, 'dest': 1,\
+            'class': 1}, seats, indexes, fees)
+        {'status': 'rejected', 'reason': 'no available seat'}
+        >>> process_request({'action': 'reserve', 'origin': 0, 'dest': 3},\
+            seats, indexes, fees)
+        {'status': 'reserved', 'seat': '2A', 'price': 200}
+        >>> process_request({'action': 'cancel', 'seat': '1A', 'origin': 2,\
+            'dest': 3}, seats, indexes, fees)
+        {'status': 'canceled', 'seat': '1A'}
+        >>> process_request({'action': 'cancel', 'seat': '1A', 'origin': 2,\
+            'dest': 3}, seats, indexes, fees)
+        {'status': 'rejected', 'reason': 'ticket does not exist'}
+        >>> seats
+        {'1A': [{'origin': 'AA', 'dest': 'BB'}], '2A': [{'origin': 'AA', 'dest': 'DD'}]}
+        >>> ticket_index = TicketIndex()
+        >>> seats = {x: SeatTickets(indexes, seat=x, index=ticket_index) \
+            for x in ('1A', '2A')}
+        >>> process_request({'action': 'reserve', 'origin': 0, 'dest': 1, \
+            'class': 2}, seats, indexes, fees)
+        {'status': 'reserved', 'seat': '2A', 'price': 100, 'ticket': 1}
+        >>> process_request({'action': 'cancel', 'ticket': 1}, \
+            seats, indexes, fees)
+        {'status': 'canceled', 'seat': '2A', 'ticket': 1, 'refund': 100}
+        >>> process_request({'action': 'cancel', 'ticket': [1]}, \
+            seats, indexes, fees)
+        {'status': 'rejected', 'reason': 'ticket does not exist'}
+        >>> process_request({'action': 'reserve', 'seat': ['1A'], \
+            'origin': 0, 'dest': 1}, seats, indexes, fees)
+        {'status': 'rejected', 'reason': 'invalid seat'}
+        >>> process_request({'action': 'reserve', 'class': '1', \
+            'origin': 0, 'dest': 1}, seats, indexes, fees, strategy= \
+            'class_aware_fit')
+        {'status': 'rejected', 'reason': 'invalid class'}
+    """
+    result = {'id': request['id']} if 'id' in request else {}
+    action = request.get('action')
+    if action not in ('reserve', 'cancel'):
+        result.update(status='rejected', reason='invalid action')
+        return result
+    if action == 'cancel' and 'ticket' in request:
+        ticket_index = get_ticket_index(train_seats)
+        ticket_id = request['ticket']
+        found = None if ticket_index is None or \
+            not isinstance(ticket_id, int) or isinstance(ticket_id, bool) \
+            else ticket_index.find(ticket_id)
+        if found is None or not ticket_index.discard(ticket_id):
+            result.update(status='rejected', reason='ticket does not exist')
+            return result
+        seat, origin_index, dest_index = found
+        if journal is not None:
+            journal.cancel(seat,
+                           get_station_name(station_indexes, origin_index),
+                           get_station_name(station_indexes, dest_index),
+                           ticket_id)
+        result.update(status='canceled', seat=seat, ticket=request['ticket'],
+                      refund=get_ticket_price(station_indexes, station_fees,
+                                              origin_index, dest_index,
+                                              int(seat[0])))
+        return result
+    origin_index = read_request_station(station_indexes,
+                                        request.get('origin'))
+    dest_index = read_request_station(station_indexes, request.get('dest'))
+    if origin_index is None or dest_index is None or \
+            dest_index <= origin_index:
+        result.update(status='rejected', reason='invalid station')
+        return result
+    seat = request.get('seat')
+    if seat is not None and (not isinstance(seat, str) or
+                             seat not in train_seats):
+        result.update(status='rejected', reason='invalid seat')
+        return result
+    seat_class = request.get('class')
+    if seat_class is not None and (not isinstance(seat_class, int) or
+                                   isinstance(seat_class, bool)):
+        result.update(status='rejected', reason='invalid class')
+        return result
+
+    if action == 'cancel':
+        if seat is None:
+            result.update(status='rejected', reason='invalid seat')
+        elif remove_ticket(train_seats, station_indexes, seat, origin_index,
+                           dest_index):
+            if journal is not None:
+                journal.cancel(seat,
+                               get_station_name(station_indexes, origin_index),
+                               get_station_name(station_indexes, dest_index))
+            result.update(status='canceled', seat=seat)
+        else:
+            result.update(status='rejected', reason='ticket does not exist')
+        return result
+
+    if seat is not None:
+        available = [seat] if check_routes_available(
+            station_indexes, train_seats[seat], origin_index,
+            dest_index) else []
+    else:
+        seat = ALLOCATION_STRATEGIES[strategy](
+            train_seats, station_indexes, origin_index, dest_index,
+            seat_class, occupancy)
+        available = [] if seat is None else [seat]
+    if not available:
+        result.update(status='rejected', reason='no available seat')
+        return result
+    seat = available[0]
+    ticket_id = update_seat(station_indexes, origin_index, dest_index,
+                            train_seats[seat], journal, seat)
+    result.update(status='reserved', seat=seat,
+                  price=get_ticket_price(station_indexes, station_fees,
+                                         origin_index, dest_index,
+                                         int(seat[0])))
+    if ticket_id is not None:
+        result['ticket'] = ticket_id
+    return result
+
+
+def run_batch(request_filename, result_filename, train_seats,
+              station_indexes, station_fees, occupancy=None, journal=None,
+              strategy='first_fit'):
+    """ Read reservation and cancellation requests from a JSON lines file, \
+        one request per line (see process_request), apply them one by one \
+        and write one JSON result line per request to result_filename
+        A line that is not valid JSON is rejected.  If result_filename is
+            '-', results are written to standard output.
+        Return the number of processed requests.
+
+        :param request_filename: string
+        :param result_filename: string
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param station_fees: dictionary of ticket fees
+        :param occupancy: OccupancyMatrix, SeatFinder or None
+        :param journal: TicketJournal or None
+        :param strategy: string
+        :return: int
+    """
+    count = 0
+    out = sys.stdout if result_filename == '-' else \
+        open(result_filename, 'w')
+    try:
+        with open(request_filename) as requests:
+            for line in requests:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if isinstance(request, dict):
+                    result = process_request(request, train_seats,
+                                             station_indexes, station_fees,
+                                             occupancy, journal, strategy)
+                else:
+                    result = {'status': 'rejected',
+                              'reason': 'invalid request'}
+                out.write(json.dumps(result) + "\n")
+                count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return count
+
+
+class ReservationEngine:
+    """ Reserve and cancel tickets of one train from many threads at once
+        Each seat has its own lock, so threads working on different seats do
+            not wait for each other.  A seat is chosen by allocation strategy
+            (see ALLOCATION_STRATEGIES) with the SeatFinder lock held, and
+            then checked again with the seat lock held before it is
+            reserved; if another thread took the journey on that seat in
+            between, the seat is chosen again.  A segment is therefore never
+            sold twice.
+        If journal is given, its lock is held while a seat is changed and the
+            change is recorded.
+        train_seats must be SeatTickets seats (see read_seats).
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param station_fees: dictionary of ticket fees
+        :param journal: TicketJournal or None
+        :param finder: SeatFinder or None (a new one is made)
+        :param strategy: string
+        >>> indexes = StationIndexes({'AA': 0, 'BB': 1, 'CC': 2})
+        >>> seats = {'1A': SeatTickets(indexes, seat='1A'), \
+            '2A': SeatTickets(indexes, seat='2A')}
+        >>> engine = ReservationEngine(seats, indexes, \
+            StationFees({'AA': [0, 0], 'BB': [200, 100], 'CC': [275, 150]}))
+        >>> engine.reserve(0, 1)
+        ('1A', 200)
+        >>> engine.reserve(1, 2, seat_class=2)
+        ('2A', 50)
+        >>> engine.reserve(0, 2, seat='1A') is None
+        True
+        >>> engine.cancel('1A', 0, 1)
+        True
+        >>> result = stress_test(engine, num_threads=8, num_operations=500)
+        >>> result['overlaps'], result['index_errors'], result['count_errors']
+        (0, 0, 0)
+        >>> engine.clear()
+        >>> result = stress_test(engine, num_operations=50, seat='2A')
+        >>> result['reserved'], result['overlaps']
+        (50, 0)
+
+        Without the seat locks, the same test sells the seat twice:
+        >>> import contextlib
+        >>> engine.seat_locks = {x: contextlib.nullcontext() \
+            for x in engine.seat_locks}
+        >>> stress_test(engine, num_operations=50, seat='2A')['overlaps'] > 0
+        True
+    """
+
+    def __init__(self, train_seats, station_indexes, station_fees,
+                 journal=None, finder=None, strategy='first_fit'):
+        self.train_seats = train_seats
+        self.station_indexes = station_indexes
+        self.station_fees = station_fees
+        self.journal = journal
+        self.finder = SeatFinder(train_seats, station_indexes) \
+            if finder is None else finder
+        self.strategy = strategy
+        self.seat_locks = {seat: threading.Lock() for seat in train_seats}
+
+    def _reserve_seat(self, seat, origin_index, dest_index):
+        with self.seat_locks[seat]:
+            if not check_routes_available(self.station_indexes,
+                                          self.train_seats[seat],
+                                          origin_index, dest_index):
+                return False
+            update_seat(self.station_indexes, origin_index, dest_index,
+                        self.train_seats[seat], self.journal, seat)
+            return True
+
+    def reserve(self, origin_index, dest_index, seat=None, seat_class=None):
+        """ Reserve ticket between origin_index and dest_index on seat, or
+            else on the seat chosen by the strategy (of seat_class if given)
+            Return (seat, ticket price), or None if there is no available
+            seat.
+        """
+        if seat is not None:
+            if not self._reserve_seat(seat, origin_index, dest_index):
+                return None
+        else:
+            choose = ALLOCATION_STRATEGIES[self.strategy]
+            while True:
+                with self.finder.lock:
+                    seat = choose(self.train_seats, self.station_indexes,
+                                  origin_index, dest_index, seat_class,
+                                  self.finder)
+                if seat is None:
+                    return None
+                if self._reserve_seat(seat, origin_index, dest_index):
+                    break
+        return seat, get_ticket_price(self.station_indexes, self.station_fees,
+                                      origin_index, dest_index, int(seat[0]))
+
+    def cancel(self, seat, origin_index, dest_index):
+        """ Cancel ticket between origin_index and dest_index on seat
+            Return True if there was such ticket.  Otherwise, return False.
+        """
+        with self.seat_locks[seat]:
+            if self.journal is None:
+                return remove_ticket(self.train_seats, self.station_indexes,
+                                     seat, origin_index, dest_index)
+            with self.journal.lock:
+                if not remove_ticket(self.train_seats, self.station_indexes,
+                                     seat, origin_index, dest_index):
+                    return False
+                self.journal.cancel(
+                    seat, get_station_name(self.station_indexes, origin_index),
+                    get_station_name(self.station_indexes, dest_index))
+                return True
+
+    def clear(self):
+        """ Cancel all tickets of all seats
+        """
+        for seat in self.train_seats:
+            self.seat_locks[seat].acquire()
+        try:
+            for seat in self.train_seats:
+                self.train_seats[seat].clear()
+            if self.journal is not None:
+                self.journal.clear()
+        finally:
+            for seat in self.train_seats:
+                self.seat_locks[seat].release()
+
+
+def count_overlaps(station_indexes, ticket_list):
+    """ Return the number of tickets in ticket_list that share a station with
+        an earlier ticket of the list (0 if no segment is sold twice)
+
+        :param station_indexes: dictionary of station indexes
+        :param ticket_list: list of tickets
+        :return: int
+        >>> count_overlaps({'AA': 0, 'BB': 1, 'CC': 2}, \
+            [{'origin': 'AA', 'dest': 'BB'}, {'origin': 'BB', 'dest': 'CC'}])
+        1
+    """
+    overlaps = 0
+    reserved_mask = 0
+    for origin_index, dest_index in get_ticket_routes(station_indexes,
+                                                      ticket_list):
+        route = get_route_mask(origin_index, dest_index)
+        overlaps += bool(reserved_mask & route)
+        reserved_mask |= route
+    return overlaps
+
+
+def stress_test(engine, num_threads=8, num_operations=1000, seed=0,
+                seat=None):
+    """ Reserve and cancel journeys through engine from num_threads threads at
+        once, num_operations each, then check that no two tickets on the
+        same seat share a station and that the TicketIndex of the seats
+        still agrees with them
+        Without seat, threads reserve random journeys and cancel some of
+            their own tickets.  With seat (a seat without tickets), every
+            thread reserves the whole line on that seat in rounds: the
+            threads start each round together (threading.Barrier), and after
+            it the overlaps of the seat are counted and its tickets canceled.
+            Only one reservation per round may succeed.
+        While the test runs, check_routes_available gives other threads a
+            turn (time.sleep(0)) after every check, so a reservation without
+            the seat lock is nearly always overtaken between check and
+            booking.
+        Return a dictionary with 'reserved', 'canceled', 'overlaps' (number
+            of tickets that shared a station with an earlier ticket of the
+            same seat, must be 0), 'index_errors' (see TicketIndex.check,
+            must be 0), 'count_errors' (1 if the number of tickets did not
+            change by reserved - canceled, must be 0) and 'tickets' (number
+            of tickets at the end).
+
+        :param engine: ReservationEngine
+        :param num_threads: int
+        :param num_operations: int
+        :param seed: int
+        :param seat: string or None
+        :return: dictionary
+    """
+    num_stations = len(engine.station_indexes)
+    counts = {'reserved': 0, 'canceled': 0, 'overlaps': 0}
+    counts_lock = threading.Lock()
+    tickets_before = sum(len(x) for x in engine.train_seats.values())
+    journey = (0, num_stations - 1)
+
+    def end_round():
+        counts['overlaps'] += count_overlaps(engine.station_indexes,
+                                             engine.train_seats[seat])
+        while engine.cancel(seat, *journey):
+            counts['canceled'] += 1
+
+    barrier = threading.Barrier(num_threads, action=end_round)
+
+    def pinned_worker():
+        reserved = 0
+        for _ in range(num_operations):
+            reserved += engine.reserve(*journey, seat=seat) is not None
+            barrier.wait()
+        with counts_lock:
+            counts['reserved'] += reserved
+
+    def worker(k):
+        rng = random.Random(seed * 1000 + k)
+        mine = []
+        reserved = canceled = 0
+        for _ in range(num_operations):
+            if mine and rng.random() < 0.3:
+                seat, origin_index, dest_index = mine.pop(
+                    rng.randrange(len(mine)))
+                canceled += engine.cancel(seat, origin_index, dest_index)
+                continue
+            origin_index, dest_index = sorted(rng.sample(range(num_stations),
+                                                         2))
+            result = engine.reserve(origin_index, dest_index)
+            if result is not None:
+                mine.append((result[0], origin_index, dest_index))
+                reserved += 1
+        with counts_lock:
+            counts['reserved'] += reserved
+            counts['canceled'] += canceled
+
+    def slow_check(*args):
+        available = check_routes(*args)
+        time.sleep(0)
+        return available
+
+    check_routes = check_routes_available
+    module = globals()
+    module['check_routes_available'] = slow_check
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=(k,))
+                   if seat is None else threading.Thread(target=pinned_worker)
+                   for k in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+        module['check_routes_available'] = check_routes
+
+    for tickets in engine.train_seats.values():
+        counts['overlaps'] += count_overlaps(engine.station_indexes, tickets)
+    tickets_after = sum(len(x) for x in engine.train_seats.values())
+    ticket_index = get_ticket_index(engine.train_seats)
+    counts['index_errors'] = 0 if ticket_index is None else \
+        ticket_index.check(engine.train_seats)
+    counts['count_errors'] = int(tickets_after - tickets_before !=
+                                 counts['reserved'] - counts['canceled'])
+    counts['tickets'] = tickets_after
+    return counts
+
+
+class HoldManager:
+    """ Two-phase reservation: hold a seat for a while, then confirm it or let
+        the hold expire
+        A hold reserves its ticket in train_seats at once (and records it in
+            journal), so nobody else can take the journey on that seat.
+            confirm(hold_id) keeps the ticket; release(hold_id) and expiry
+            cancel it.  A restart keeps pending holds as reserved tickets.
+        For SeatTickets seats, a hold keeps the id of its ticket, so release
+            removes exactly that ticket even if the seat has other tickets
+            for the same journey.
+        Expiry times are kept in a heap, so expire() only looks at the holds
+            that have expired (and at confirmed or released holds whose time
+            has passed), never at all tickets.
+        clock returns the current time in seconds.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param station_fees: dictionary of ticket fees
+        :param journal: TicketJournal or None
+        :param finder: OccupancyMatrix, SeatFinder or None
+        :param strategy: string
+        :param clock: function
+        >>> now = [0]
+        >>> indexes = StationIndexes({'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3})
+        >>> seats = {'1A': SeatTickets(indexes, seat='1A')}
+        >>> holds = HoldManager(seats, indexes, \
+            {'AA': [0], 'BB': [200], 'CC': [275], 'DD': [300]}, \
+            clock=lambda: now[0])
+        >>> holds.hold(0, 1, ttl=10)
+        (1, '1A', 200)
+        >>> holds.hold(2, 3, ttl=20)
+        (2, '1A', 25)
+        >>> holds.hold(0, 3) is None
+        True
+        >>> holds.hold(0, 3, ttl='10')
+        Traceback (most recent call last):
+        ...
+        ValueError: invalid ttl
+        >>> holds.hold(3, 1)
+        Traceback (most recent call last):
+        ...
+        ValueError: invalid station
+        >>> now[0] = 15
+        >>> holds.confirm(1)
+        False
+        >>> holds.expire()
+        [1]
+        >>> holds.confirm(2)
+        True
+        >>> seats
+        {'1A': [{'origin': 'CC', 'dest': 'DD'}]}
+    """
+
+    def __init__(self, train_seats, station_indexes, station_fees,
+                 journal=None, finder=None, strategy='first_fit',
+                 clock=time.monotonic):
+        self.train_seats = train_seats
+        self.station_indexes = station_indexes
+        self.station_fees = station_fees
+        self.journal = journal
+        self.finder = finder
+        self.strategy = strategy
+        self.clock = clock
+        self.holds = {}
+        self.expiries = []
+        self.last_id = 0
+
+    def hold(self, origin_index, dest_index, seat=None, seat_class=None,
+             ttl=600):
+        """ Hold ticket between origin_index and dest_index on seat, or else
+            on the seat chosen by the strategy (of seat_class if given), for
+            ttl seconds
+            Return (hold id, seat, ticket price), or None if there is no
+            available seat.  Raise ValueError, before changing anything, if
+            origin_index and dest_index are not station indexes with
+            origin_index before dest_index, ttl is not a positive number,
+            seat_class is not an int or seat is not a seat of the train.
+        """
+        if not all(isinstance(x, int) and not isinstance(x, bool)
+                   for x in (origin_index, dest_index)) or \
+                not 0 <= origin_index < dest_index < len(self.station_indexes):
+            raise ValueError("invalid station")
+        if not isinstance(ttl, (int, float)) or isinstance(ttl, bool) or \
+                not 0 < ttl < float('inf'):
+            raise ValueError("invalid ttl")
+        if seat_class is not None and (not isinstance(seat_class, int) or
+                                       isinstance(seat_class, bool)):
+            raise ValueError("invalid class")
+        if seat is not None and (not isinstance(seat, str) or
+                                 seat not in self.train_seats):
+            raise ValueError("invalid seat")
+        self.expire()
+        if seat is None:
+            seat = ALLOCATION_STRATEGIES[self.strategy](
+                self.train_seats, self.station_indexes, origin_index,
+                dest_index, seat_class, self.finder)
+            if seat is None:
+                return None
+        elif not check_routes_available(self.station_indexes,
+                                        self.train_seats[seat], origin_index,
+                                        dest_index):
+            return None
+        ticket_id = update_seat(self.station_indexes, origin_index,
+                                dest_index, self.train_seats[seat],
+                                self.journal, seat)
+        self.last_id += 1
+        expires = self.clock() + ttl
+        self.holds[self.last_id] = (seat, origin_index, dest_index, expires,
+                                    ticket_id)
+        heapq.heappush(self.expiries, (expires, self.last_id))
+        return self.last_id, seat, get_ticket_price(
+            self.station_indexes, self.station_fees, origin_index, dest_index,
+            int(seat[0]))
+
+    def confirm(self, hold_id):
+        """ Keep the ticket of hold hold_id
+            Return True, or False if there is no such hold or it has expired.
+        """
+        hold = self.holds.get(hold_id)
+        if hold is None or hold[3] <= self.clock():
+            return False
+        del self.holds[hold_id]
+        return True
+
+    def release(self, hold_id):
+        """ Cancel the ticket of hold hold_id
+            Return True, or False if there is no such hold.
+        """
+        hold = self.holds.pop(hold_id, None)
+        if hold is None:
+            return False
+        seat, origin_index, dest_index, _, ticket_id = hold
+        if ticket_id is not None:
+            removed = self.train_seats[seat].discard_id(ticket_id)
+        else:
+            removed = remove_ticket(self.train_seats, self.station_indexes,
+                                    seat, origin_index, dest_index)
+        if removed and self.journal is not None:
+            self.journal.cancel(
+                seat, get_station_name(self.station_indexes, origin_index),
+                get_station_name(self.station_indexes, dest_index), ticket_id)
+        return True
+
+    def expire(self):
+        """ Cancel the tickets of all holds that have expired
+            Return the list of their hold ids.
+        """
+        now = self.clock()
+        expired = []
+        while self.expiries and self.expiries[0][0] <= now:
+            _, hold_id = heapq.heappop(self.expiries)
+            if self.release(hold_id):
+                expired.append(hold_id)
+        return expired
+
+    def clear(self):
+        """ Forget all holds (when all tickets are cleared)
+        """
+        self.holds.clear()
+        self.expiries.clear()
+
+
+class TrainLine:
+    """ Everything of one train line: ticket fees, station indexes, seats,
+        seat classes, and the SeatFinder, AvailabilityCache, TicketJournal,
+        ReservationEngine and HoldManager of the seats
+        No OccupancyMatrix is kept: keeping it up to date would slow down
+            every ticket change.  Use build_occupancy_matrix to make one when
+            needed (as main does for --search matrix).
+
+        :param name: string
+        :param station_fees: dictionary of ticket fees
+        :param station_indexes: dictionary of station indexes
+        :param train_seats: dictionary of seats
+        :param train_seat_classes: list of seat classes
+        :param journal: TicketJournal or None
+    """
+
+    def __init__(self, name, station_fees, station_indexes, train_seats,
+                 train_seat_classes, journal=None):
+        self.name = name
+        self.station_fees = station_fees
+        self.station_indexes = station_indexes
+        self.train_seats = train_seats
+        self.train_seat_classes = train_seat_classes
+        self.journal = journal
+        self.finder = SeatFinder(train_seats, station_indexes)
+        self.cache = AvailabilityCache(train_seats, station_indexes)
+        self.engine = ReservationEngine(train_seats, station_indexes,
+                                        station_fees, journal, self.finder)
+        self.holds = HoldManager(train_seats, station_indexes, station_fees,
+                                 journal, self.finder)
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+
+def load_train_line(name, station_filename, seat_filename, ticket_filename,
+                    station_names=None):
+    """ Load one train line and return it as TrainLine
+        Stations, seats and reserved tickets are read from
+            <name>_train.snapshot if it is newer than all three files,
+            otherwise from the files.  Then the journal of ticket_filename
+            (same name, ending .journal) is replayed on top.
+        Malformed reserved ticket lines are reported to standard error.
+
+    :param name: string
+    :param station_filename: string
+    :param seat_filename: string
+    :param ticket_filename: string
+    :param station_names: dictionary of station names shared by lines
+    :return: TrainLine
+    """
+    snapshot_filename = f"{name}_train.snapshot"
+    if is_snapshot_current(snapshot_filename, [
+            station_filename, seat_filename, ticket_filename]):
+        station_fees, station_indexes, train_seats, train_seat_classes = \
+            read_snapshot(snapshot_filename, station_names)
     else:
-        print("Invalid choice. Choose again.")
+        station_fees, station_indexes = read_stations(station_filename,
+                                                      station_names)
+        train_seats, train_seat_classes = read_seats(seat_filename,
+                                                     station_indexes)
+        for line_number, reason in read_reserved_tickets(
+                ticket_filename, train_seats, station_indexes):
+            print(f"{ticket_filename} line {line_number}: {reason}",
+                  file=sys.stderr)
+    journal = TicketJournal(ticket_filename,
+                            os.path.splitext(ticket_filename)[0] + '.journal',
+                            train_seats, station_indexes)
+    return TrainLine(name, station_fees, station_indexes, train_seats,
+                     train_seat_classes, journal)
+
+
+class TrainInventory:
+    """ Runs of one train line: one set of seats for each (service date,
+        train number), loaded when first asked for
+        Stations, ticket fees and the seat list are read once and shared by
+            all runs; each run has only its own tickets.  Tickets of a run
+            are kept in <run_directory>/<date>/<train number>_reserved_
+            tickets.txt with its journal next to it.
+        At most max_runs runs stay in memory.  Asking for another run evicts
+            the least recently used one: its journal is compacted into its
+            ticket file and it is closed.  evict_idle(seconds) also evicts
+            runs nobody asked for in that time.  A run with holds that have
+            not expired (see HoldManager) is kept until they are confirmed,
+            released or expire, even if that means more than max_runs runs.
+        Ticket ids are saved with the tickets, so they stay the same when an
+            evicted run is loaded again.
+
+        :param name: string
+        :param station_filename: string
+        :param seat_filename: string
+        :param run_directory: string
+        :param max_runs: int
+        :param station_names: dictionary of station names shared by lines
+        :param clock: function
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> station_filename = os.path.join(directory, 'stations.txt')
+        >>> seat_filename = os.path.join(directory, 'seats.txt')
+        >>> write_stations(station_filename, {'Bangkok': [0, 0], \
+            'Sam Sen': [800, 600], 'Bang Sue Junction': [800, 600], \
+            'Bang Bamru': [830, 620]}, {'Bangkok': 0, 'Sam Sen': 1, \
+            'Bang Sue Junction': 2, 'Bang Bamru': 3})
+        >>> write_seats(seat_filename, {'1A': [], '1B': [], '2A': []})
+        >>> inventory = TrainInventory('south', station_filename, \
+            seat_filename, directory, max_runs=1)
+        >>> run = inventory.run('2026-12-30', 171)
+        >>> run.name, len(run.train_seats), sum(map(len, \
+            run.train_seats.values()))
+        ('south/2026-12-30/171', 3, 0)
+        >>> process_request({'action': 'reserve', 'origin': 0, 'dest': 3}, \
+            run.train_seats, run.station_indexes, run.station_fees, \
+            journal=run.journal)['seat']
+        '1A'
+        >>> inventory.run('2026-12-31', 171).station_fees is run.station_fees
+        True
+        >>> list(inventory.runs)
+        [('2026-12-31', 171)]
+        >>> run = inventory.run('2026-12-30', 171)
+        >>> run.train_seats['1A'], run.train_seats['1A'].ids
+        ([{'origin': 'Bangkok', 'dest': 'Bang Bamru'}], array('I', [1]))
+        >>> run.holds.hold(0, 1)
+        (1, '1B', 800)
+        >>> _ = inventory.run('2026-12-31', 171)
+        >>> list(inventory.runs)
+        [('2026-12-30', 171), ('2026-12-31', 171)]
+        >>> run.holds.release(1)
+        True
+        >>> _ = inventory.run('2026-12-29', 171)
+        >>> list(inventory.runs)
+        [('2026-12-29', 171)]
+        >>> inventory.close()
+        >>> shutil.rmtree(directory)
+    """
+
+    def __init__(self, name, station_filename, seat_filename, run_directory,
+                 max_runs=8, station_names=None, clock=time.monotonic):
+        self.name = name
+        self.run_directory = run_directory
+        self.max_runs = max_runs
+        self.clock = clock
+        self.station_fees, self.station_indexes = read_stations(
+            station_filename, station_names)
+        self.seat_names = open(seat_filename).read().splitlines()
+        self.seat_classes = []
+        for x in self.seat_names:
+            if int(x[0]) not in self.seat_classes:
+                self.seat_classes.append(int(x[0]))
+        # (date, train number): TrainLine, least recently used first
+        self.runs = OrderedDict()
+        self.last_used = {}
+
+    def ticket_filename(self, service_date, train_number):
+        return os.path.join(self.run_directory, service_date,
+                            f"{train_number}_reserved_tickets.txt")
+
+    def run(self, service_date, train_number):
+        """ Return the TrainLine of the run on service_date (ISO string or
+            datetime.date) with train_number, loading it if needed
+        """
+        key = (str(service_date), train_number)
+        if key in self.runs:
+            self.runs.move_to_end(key)
+        else:
+            self.runs[key] = self._load(*key)
+            for old_key in list(self.runs)[:-1]:
+                if len(self.runs) <= self.max_runs:
+                    break
+                if not self.has_holds(old_key):
+                    self.evict(old_key)
+        self.last_used[key] = self.clock()
+        return self.runs[key]
+
+    def _load(self, service_date, train_number):
+        ticket_filename = self.ticket_filename(service_date, train_number)
+        os.makedirs(os.path.dirname(ticket_filename), exist_ok=True)
+        watchers = []
+        ticket_index = TicketIndex()
+        train_seats = {x: SeatTickets(self.station_indexes, seat=x,
+                                      watchers=watchers, index=ticket_index)
+                       for x in self.seat_names}
+        if os.path.exists(ticket_filename):
+            for line_number, reason in read_reserved_tickets(
+                    ticket_filename, train_seats, self.station_indexes):
+                print(f"{ticket_filename} line {line_number}: {reason}",
+                      file=sys.stderr)
+        journal = TicketJournal(
+            ticket_filename, os.path.splitext(ticket_filename)[0] + '.journal',
+            train_seats, self.station_indexes)
+        return TrainLine(f"{self.name}/{service_date}/{train_number}",
+                         self.station_fees, self.station_indexes, train_seats,
+                         self.seat_classes, journal)
+
+    def has_holds(self, key):
+        """ Return True if run key ((date, train number)) has holds that
+            have not expired
+        """
+        holds = self.runs[key].holds
+        holds.expire()
+        return bool(holds.holds)
+
+    def evict(self, key):
+        """ Save run key ((date, train number)) to its ticket file and drop it
+            from memory
+            Holds of the run are lost (their tickets stay reserved), so
+            run and evict_idle never evict a run that has holds.
+        """
+        line = self.runs.pop(key)
+        del self.last_used[key]
+        line.journal.compact()
+        line.close()
+
+    def evict_idle(self, seconds):
+        """ Evict runs not asked for in the last seconds seconds
+        """
+        now = self.clock()
+        for key in [k for k, t in self.last_used.items()
+                    if now - t >= seconds]:
+            if not self.has_holds(key):
+                self.evict(key)
+
+    def close(self):
+        for key in list(self.runs):
+            self.evict(key)
+
+
+# how many days ahead a run can be booked
+BOOKING_HORIZON_DAYS = 90
+
+
+def check_service_date(service_date, today=None):
+    """ Return service_date (ISO string) as datetime.date if it is from
+        today to BOOKING_HORIZON_DAYS days ahead, otherwise None
+
+        :param service_date: string
+        :param today: datetime.date or None for today
+        :return: datetime.date or None
+        >>> check_service_date('2026-03-01', datetime.date(2026, 2, 1))
+        datetime.date(2026, 3, 1)
+        >>> check_service_date('2026-06-01', datetime.date(2026, 2, 1)) is None
+        True
+        >>> check_service_date('1 March', datetime.date(2026, 2, 1)) is None
+        True
+    """
+    today = datetime.date.today() if today is None else today
+    try:
+        date = datetime.date.fromisoformat(str(service_date))
+    except ValueError:
+        return None
+    if not 0 <= (date - today).days <= BOOKING_HORIZON_DAYS:
+        return None
+    return date
+
+
+class TrainService:
+    """ Any number of train lines in one process
+        lines is a dictionary where key is line name, and value is (station
+            file, seat file, reserved ticket file).  A line is loaded the
+            first time line(name) asks for it.
+        Each line has its own tables, but station names are shared, so a
+            station on several lines (e.g. Bangkok) is stored once.
+        run(name, date, train number) gives one dated run of a line from the
+            TrainInventory of the line (runs kept in <name>_runs, at most
+            max_runs of each line in memory).
+
+        :param lines: dictionary of line files
+        :param max_runs: int
+    """
+
+    def __init__(self, lines=None, max_runs=8):
+        self.line_files = dict(TRAIN_LINES if lines is None else lines)
+        self.lines = {}
+        self.station_names = {}
+        self.inventories = {}
+        self.max_runs = max_runs
+
+    def load_line(self, name, station_filename, seat_filename,
+                  ticket_filename):
+        self.line_files[name] = (station_filename, seat_filename,
+                                 ticket_filename)
+        self.lines[name] = load_train_line(name, station_filename,
+                                           seat_filename, ticket_filename,
+                                           self.station_names)
+        return self.lines[name]
+
+    def line(self, name):
+        if name not in self.lines:
+            self.load_line(name, *self.line_files[name])
+        return self.lines[name]
+
+    def run(self, name, service_date, train_number):
+        if name not in self.inventories:
+            station_filename, seat_filename, _ = self.line_files[name]
+            self.inventories[name] = TrainInventory(
+                name, station_filename, seat_filename, f"{name}_runs",
+                self.max_runs, self.station_names)
+        return self.inventories[name].run(service_date, train_number)
+
+    def loaded_lines(self):
+        """ Return all TrainLine in memory: lines and runs
+        """
+        return list(self.lines.values()) + [
+            line for inventory in self.inventories.values()
+            for line in inventory.runs.values()]
+
+    def close(self):
+        for line in self.lines.values():
+            line.close()
+        for inventory in self.inventories.values():
+            inventory.close()
+
+
+# name: (station file, seat file, reserved ticket file)
+TRAIN_LINES = {
+    'south': ('south_stations.txt', 'south_train_seats.txt',
+              'south_reserved_tickets.txt'),
+    'north': ('north_stations.txt', 'north_train_seats.txt',
+              'north_reserved_tickets.txt'),
+}
+
+
+def build_parser():
+    """ Return the command line parser of main
+
+        :return: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description="Reserve train tickets")
+    parser.add_argument('--doctest', action='store_true',
+                        help="run the doctests of this module and exit")
+    parser.add_argument('--line', choices=TRAIN_LINES, default='south',
+                        help="train line to start with")
+    parser.add_argument('--date',
+                        help="service date (YYYY-MM-DD) of the run to use "
+                             "instead of the line's own tickets")
+    parser.add_argument('--train', type=int,
+                        help="train number of the run (with --date)")
+    parser.add_argument('--batch', nargs='+', metavar='FILE',
+                        help="<request file> [<result file>]: apply JSON "
+                             "lines requests to the line instead of the menu")
+    parser.add_argument('--strategy', choices=ALLOCATION_STRATEGIES,
+                        default='first_fit',
+                        help="seat allocation strategy of --batch and "
+                             "--serve")
+    parser.add_argument('--search', choices=('finder', 'matrix'),
+                        default='finder',
+                        help="seat search of --batch: SeatFinder tree, or "
+                             "NumPy occupancy matrix (each seat checked in "
+                             "turn if NumPy is not installed)")
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help="serve JSON lines requests on HOST:PORT or a "
+                             "Unix socket path instead of the menu")
+    parser.add_argument('--report', choices=('table', 'csv'),
+                        help="print the load factor report of the line")
+    parser.add_argument('--show', choices=('seats', 'prices'),
+                        help="print the tickets (with prices) of the line")
+    parser.add_argument('--seat', action='append',
+                        help="seat to --show (default: all)")
+    parser.add_argument('--class', type=int, dest='seat_class',
+                        help="seat class to --show")
+    parser.add_argument('--page', type=int,
+                        help="page of seats to --show (from 1)")
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--instrument', metavar='FILE',
+                        help="count and time hot functions, and write the "
+                             "report to FILE as JSON at exit")
+    parser.add_argument('--sample-every', type=int, default=1,
+                        help="time one call in this many with --instrument")
+    parser.add_argument('--profile', metavar='PREFIX',
+                        help="profile --show, --report, --batch or --serve "
+                             "and write PREFIX.collapsed (stack samples) "
+                             "and PREFIX.memory.txt")
+    parser.add_argument('--snapshot', nargs=4,
+                        metavar=('STATIONS', 'SEATS', 'TICKETS', 'SNAPSHOT'),
+                        help="convert text files to a binary snapshot")
+    parser.add_argument('--text', nargs=4,
+                        metavar=('SNAPSHOT', 'STATIONS', 'SEATS', 'TICKETS'),
+                        help="convert a binary snapshot to text files")
+    return parser
+
+
+def run_menu(service, line_name):
+    """ Show the menu and run the chosen actions until user exits
+        Start with line line_name; other lines are loaded when chosen.
+
+        :param service: TrainService
+        :param line_name: string
+        :return: nothing
+    """
+    line = service.line(line_name)
+    while True:
+        print()
+        print(f"Line: {line.name}")
+        print('1. Show seats')
+        print('2. Reserve ticket')
+        print('3. Cancel ticket')
+        print('4. Show ticket prices')
+        print('5. Clear all tickets')
+        print('6. Exit')
+        print('7. Change line')
+        choice = int(input('Enter your choice: '))
+        if choice == 1:
+            show_seats(line.train_seats, line.station_indexes)
+        elif choice == 2:
+            reserve(line.train_seats, line.train_seat_classes,
+                    line.station_indexes, line.station_fees, line.cache,
+                    line.journal)
+        elif choice == 3:
+            cancel(line.train_seats, line.station_indexes, line.journal)
+        elif choice == 4:
+            show_ticket_prices(line.train_seats, line.station_indexes,
+                               line.station_fees)
+        elif choice == 5:
+            clear_tickets(line.train_seats, line.station_indexes,
+                          line.journal)
+        elif choice == 6:
+            break
+        elif choice == 7:
+            name = input(f"Enter line {list(service.line_files)}: ")
+            if name in service.line_files:
+                line = service.line(name)
+            else:
+                print("Invalid line.")
+        else:
+            print("Invalid choice. Choose again.")
+
+
+def main(argv=None):
+    """ Entry point: convert files, print tickets or a report, run a batch,
+        serve clients, or show the menu, depending on command line arguments
+        argv (see build_parser)
+        Nothing is loaded until main is called.  --doctest runs the
+            doctests instead.
+
+        :param argv: list of strings, or None for sys.argv[1:]
+        :return: nothing
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.doctest:
+        import doctest
+
+        doctest.testmod(sys.modules[__name__])
+        return
+    if args.profile and not (args.show or args.report or args.batch or
+                             args.serve):
+        parser.error("--profile needs --show, --report, --batch or --serve")
+    if args.date and (args.train is None or args.train < 1 or
+                      check_service_date(args.date) is None):
+        parser.error(f"--date needs --train (from 1) and a date from today "
+                     f"to {BOOKING_HORIZON_DAYS} days ahead")
+    if args.snapshot:
+        for line_number, reason in convert_to_snapshot(*args.snapshot):
+            print(f"{args.snapshot[2]} line {line_number}: {reason}",
+                  file=sys.stderr)
+        return
+    if args.text:
+        convert_from_snapshot(*args.text)
+        return
+
+    service = TrainService()
+    instrumentation = None
+    if args.instrument:
+        from train_instrumentation import INSTRUMENTATION as instrumentation
+
+        instrumentation.enable(sample_every=args.sample_every)
+    profiler = None
+    if args.profile:
+        from train_profiler import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+
+    def get_line():
+        if args.date:
+            return service.run(args.line, args.date, args.train)
+        return service.line(args.line)
+
+    try:
+        if args.show:
+            line = get_line()
+            if args.show == 'seats':
+                show_seats(line.train_seats, line.station_indexes, args.seat,
+                           args.seat_class, args.page, args.page_size)
+            else:
+                show_ticket_prices(line.train_seats, line.station_indexes,
+                                   line.station_fees, args.seat,
+                                   args.seat_class, args.page, args.page_size)
+        elif args.report:
+            line = get_line()
+            show_load_report(line.train_seats, line.station_indexes,
+                             args.report)
+        elif args.batch:
+            line = get_line()
+            occupancy = line.finder
+            if args.search == 'matrix':
+                # None without NumPy: each seat is checked in turn
+                occupancy = build_occupancy_matrix(line.train_seats,
+                                                   line.station_indexes)
+            run_batch(args.batch[0],
+                      args.batch[1] if len(args.batch) > 1 else '-',
+                      line.train_seats, line.station_indexes,
+                      line.station_fees, occupancy, line.journal,
+                      args.strategy)
+        elif args.serve:
+            from train_server import run_server
+
+            run_server(service, args.serve, args.line, args.strategy)
+        else:
+            run_menu(service, args.line)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.write(args.profile, service.loaded_lines())
+        service.close()
+        if instrumentation is not None:
+            instrumentation.disable()
+            instrumentation.dump(args.instrument)
+            instrumentation.log()
+
 
 if __name__ == '__main__':
-    import doctest
+    # run main of the importable module, so that modules importing
+    # manage_train (train_instrumentation, ...) share its classes and globals
+    import manage_train
 
-    doctest.testmod()
+    manage_train.main()
@@ -0,0 +1,379 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from manage_train import (ALLOCATION_STRATEGIES, TRAIN_LINES, SeatFinder,
+                          SeatTickets, StationIndexes, get_reserved_mask,
+                          get_ticket_price, read_reserved_tickets, read_seats,
+                          read_stations, update_seat)
+
+
+def random_journeys(num_stations, seat_classes, num_requests, seed=0):
+    """ Return a list of num_requests random journeys
+        (origin station index, dest station index, seat class), with origin
+        and destination drawn uniformly and origin < destination
+        The same seed always gives the same journeys, so every strategy can
+            be run on the same requests.
+
+        :param num_stations: int
+        :param seat_classes: list of seat classes
+        :param num_requests: int
+        :param seed: int
+        :return: list of (int, int, int)
+    """
+    rng = random.Random(seed)
+    journeys = []
+    for _ in range(num_requests):
+        origin_index, dest_index = sorted(rng.sample(range(num_stations), 2))
+        journeys.append((origin_index, dest_index, rng.choice(seat_classes)))
+    return journeys
+
+
+def get_occupancy(train_seats, station_indexes):
+    """ Return the share of (seat, station) pairs that are on a reserved
+        ticket, from 0.0 (empty train) to 1.0 (every seat full everywhere)
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :return: float
+        >>> get_occupancy({'1A': [{'origin': 'AA', 'dest': 'BB'}], '1B': []},\
+            {'AA': 0, 'BB': 1, 'CC': 2, 'DD': 3})
+        0.25
+    """
+    reserved = sum(bin(get_reserved_mask(station_indexes,
+                                         train_seats[i])).count("1")
+                   for i in train_seats)
+    return reserved / (len(train_seats) * len(station_indexes))
+
+
+def simulate(train_seats, station_indexes, station_fees, journeys, strategy):
+    """ Reserve every journey in journeys with allocation strategy (see
+        ALLOCATION_STRATEGIES) and return a summary dictionary:
+        'strategy', 'requests', 'reserved', 'rejected', 'rejection_rate',
+        'occupancy' (see get_occupancy) and 'revenue' (sum of ticket prices)
+        train_seats (SeatTickets seats, as read_seats gives with
+            station_indexes) is changed in place.
+
+        :param train_seats: dictionary of seats
+        :param station_indexes: dictionary of station indexes
+        :param station_fees: dictionary of ticket fees
+        :param journeys: list of (int, int, int)
+        :param strategy: string
+        :return: dictionary
+        >>> indexes = StationIndexes({'AA': 0, 'BB': 1, 'CC': 2})
+        >>> seats = {'1A': SeatTickets(indexes, seat='1A'), \
+            '1B': SeatTickets(indexes, seat='1B')}
+        >>> result = simulate(seats, indexes, \
+            {'AA': [0], 'BB': [100], 'CC': [150]}, \
+            [(0, 1, 1), (0, 2, 1), (1, 2, 1)], 'first_fit')
+        >>> result['reserved'], result['rejected'], result['revenue']
+        (2, 1, 250)
+    """
+    choose = ALLOCATION_STRATEGIES[strategy]
+    finder = SeatFinder(train_seats, station_indexes)
+    reserved = 0
+    revenue = 0
+    for origin_index, dest_index, seat_class in journeys:
+        seat = choose(train_seats, station_indexes, origin_index, dest_index,
+                      seat_class, finder)
+        if seat is None:
+            continue
+        update_seat(station_indexes, origin_index, dest_index,
+                    train_seats[seat])
+        reserved += 1
+        revenue += get_ticket_price(station_indexes, station_fees,
+                                    origin_index, dest_index, int(seat[0]))
+    rejected = len(journeys) - reserved
+    return {'strategy': strategy, 'requests': len(journeys),
+            'reserved': reserved, 'rejected': rejected,
+            'rejection_rate': rejected / len(journeys) if journeys else 0.0,
+            'occupancy': get_occupancy(train_seats, station_indexes),
+            'revenue': revenue}
+
+
+def compare_strategies(station_filename, seat_filename, ticket_filename,
+                       num_requests, seed=0, strategies=None):
+    """ Run simulate once for each strategy, each time on a fresh train
+        loaded from the files, with the same random journeys
+        Return a list of summary dictionaries, one for each strategy.
+
+        :param station_filename: string
+        :param seat_filename: string
+        :param ticket_filename: string or None (start with an empty train)
+        :param num_requests: int
+        :param seed: int
+        :param strategies: list of strings, or None for all strategies
+        :return: list of dictionaries
+    """
+    results = []
+    journeys = None
+    for strategy in strategies or list(ALLOCATION_STRATEGIES):
+        station_fees, station_indexes = read_stations(station_filename)
+        train_seats, train_seat_classes = read_seats(seat_filename,
+                                                     station_indexes)
+        if ticket_filename is not None:
+            read_reserved_tickets(ticket_filename, train_seats,
+                                  station_indexes)
+        if journeys is None:
+            journeys = random_journeys(len(station_indexes),
+                                       train_seat_classes, num_requests, seed)
+        results.append(simulate(train_seats, station_indexes, station_fees,
+                                journeys, strategy))
+    return results
+
+
+def show_results(results):
+    """ Display summaries from compare_strategies as a table
+
+        :param results: list of dictionaries
+        :return: nothing
+        >>> show_results([{'strategy': 'first_fit', 'requests': 10, \
+            'reserved': 8, 'rejected': 2, 'rejection_rate': 0.2, \
+            'occupancy': 0.5, 'revenue': 1200}])
+        strategy      requests  reserved  rejected  rejected %  occupancy %     revenue
+        first_fit           10         8         2        20.0         50.0        1200
+    """
+    print(f"{'strategy':<12}{'requests':>10}{'reserved':>10}{'rejected':>10}"
+          f"{'rejected %':>12}{'occupancy %':>13}{'revenue':>12}")
+    for x in results:
+        print(f"{x['strategy']:<12}{x['requests']:>10}{x['reserved']:>10}"
+              f"{x['rejected']:>10}{x['rejection_rate'] * 100:>12.1f}"
+              f"{x['occupancy'] * 100:>13.1f}{x['revenue']:>12}")
+
+
+def read_demand(demand_filename, station_indexes):
+    """ Read demand file
+        Each line contains station name, origin weight and destination
+            weight, e.g. 'Hat Yai Junction,5,20': journeys start there with
+            weight 5 and end there with weight 20.  Stations not in the file
+            have weight 1 for both.  Raise ValueError for a station that is
+            not a station of the line.
+        Return two lists of weights by station index: origin weights and
+            destination weights.
+
+        :param demand_filename: string
+        :param station_indexes: dictionary of station indexes
+        :return: list of floats, list of floats
+    """
+    origin_weights = [1.0] * len(station_indexes)
+    dest_weights = [1.0] * len(station_indexes)
+    for x in open(demand_filename).read().splitlines():
+        if not x.strip():
+            continue
+        name, origin_weight, dest_weight = x.rsplit(',', 2)
+        if name not in station_indexes:
+            raise ValueError(f"unknown station {name}")
+        origin_weights[station_indexes[name]] = float(origin_weight)
+        dest_weights[station_indexes[name]] = float(dest_weight)
+    return origin_weights, dest_weights
+
+
+def demand_journeys(origin_weights, dest_weights, seat_classes, num_requests,
+                    seed=0):
+    """ Return a list of num_requests random journeys
+        (origin station index, dest station index, seat class), with origin
+        drawn by origin_weights and destination by dest_weights among the
+        stations after origin
+        A journey from a station where no later station has weight is drawn
+            again.  Raise ValueError if no station with origin weight has a
+            later station with destination weight, since then no journey
+            can ever be drawn.
+
+        :param origin_weights: list of floats, one for each station index
+        :param dest_weights: list of floats, one for each station index
+        :param seat_classes: list of seat classes
+        :param num_requests: int
+        :param seed: int
+        :return: list of (int, int, int)
+        >>> demand_journeys([1, 0, 0], [0, 0, 1], [2], 2)
+        [(0, 2, 2), (0, 2, 2)]
+        >>> demand_journeys([1, 1, 0], [1, 0, 0], [1], 3)
+        Traceback (most recent call last):
+        ...
+        ValueError: no journey has both origin and destination weight
+    """
+    if not any(origin_weights[i] and any(dest_weights[i + 1:])
+               for i in range(len(origin_weights) - 1)):
+        raise ValueError("no journey has both origin and destination weight")
+    rng = random.Random(seed)
+    origins = range(len(origin_weights) - 1)
+    journeys = []
+    while len(journeys) < num_requests:
+        origin_index = rng.choices(origins, origin_weights[:-1])[0]
+        weights = dest_weights[origin_index + 1:]
+        if not any(weights):
+            continue
+        dest_index = origin_index + 1 + rng.choices(range(len(weights)),
+                                                    weights)[0]
+        journeys.append((origin_index, dest_index, rng.choice(seat_classes)))
+    return journeys
+
+
+def run_trial(station_filename, seat_filename, ticket_filename,
+              demand_filename, num_requests, strategy, seed):
+    """ Load a fresh train from the files and simulate num_requests
+        journeys drawn from the demand file (uniform if demand_filename is
+        None) with seed
+        Return the summary dictionary of simulate.  This runs in a worker
+            process of monte_carlo, so everything it needs is loaded here.
+
+        :param station_filename: string
+        :param seat_filename: string
+        :param ticket_filename: string or None (start with an empty train)
+        :param demand_filename: string or None
+        :param num_requests: int
+        :param strategy: string
+        :param seed: int
+        :return: dictionary
+    """
+    station_fees, station_indexes = read_stations(station_filename)
+    train_seats, train_seat_classes = read_seats(seat_filename,
+                                                 station_indexes)
+    if ticket_filename is not None:
+        read_reserved_tickets(ticket_filename, train_seats, station_indexes)
+    if demand_filename is not None:
+        origin_weights, dest_weights = read_demand(demand_filename,
+                                                   station_indexes)
+    else:
+        origin_weights = dest_weights = [1.0] * len(station_indexes)
+    journeys = demand_journeys(origin_weights, dest_weights,
+                               train_seat_classes, num_requests, seed)
+    return simulate(train_seats, station_indexes, station_fees, journeys,
+                    strategy)
+
+
+def summarize_trials(results):
+    """ Return 'mean', 'stdev', 'min' and 'max' of 'occupancy' (load
+        factor), 'revenue' and 'rejection_rate' over summaries of simulate,
+        with 'strategy' and 'trials'
+
+        :param results: list of dictionaries
+        :return: dictionary
+        >>> summarize_trials([{'strategy': 'first_fit', 'occupancy': 0.5, \
+            'revenue': 100, 'rejection_rate': 0.1}, {'strategy': \
+            'first_fit', 'occupancy': 0.7, 'revenue': 300, \
+            'rejection_rate': 0.3}])['revenue']
+        {'mean': 200, 'stdev': 141.4213562373095, 'min': 100, 'max': 300}
+    """
+    summary = {'strategy': results[0]['strategy'], 'trials': len(results)}
+    for key in ('occupancy', 'revenue', 'rejection_rate'):
+        values = [x[key] for x in results]
+        summary[key] = {
+            'mean': statistics.mean(values),
+            'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+            'min': min(values), 'max': max(values)}
+    return summary
+
+
+def monte_carlo(station_filename, seat_filename, ticket_filename,
+                num_trials, num_requests, strategy='first_fit',
+                demand_filename=None, workers=None, seed=0):
+    """ Run num_trials independent trials (see run_trial, seeds seed,
+        seed + 1, ...) on a pool of worker processes and summarize them
+        (see summarize_trials)
+        Trials share nothing, so they run in parallel on all workers.
+
+        :param station_filename: string
+        :param seat_filename: string
+        :param ticket_filename: string or None (start with an empty train)
+        :param num_trials: int
+        :param num_requests: int
+        :param strategy: string
+        :param demand_filename: string or None
+        :param workers: int or None for the number of processors
+        :param seed: int
+        :return: dictionary
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            run_trial, [station_filename] * num_trials,
+            [seat_filename] * num_trials, [ticket_filename] * num_trials,
+            [demand_filename] * num_trials, [num_requests] * num_trials,
+            [strategy] * num_trials, range(seed, seed + num_trials),
+            chunksize=max(1, num_trials // (4 * workers))))
+    return summarize_trials(results)
+
+
+def show_monte_carlo(summaries):
+    """ Display summaries from monte_carlo as a table (mean ± stdev)
+
+        :param summaries: list of dictionaries
+        :return: nothing
+        >>> show_monte_carlo([{'strategy': 'best_fit', 'trials': 8, \
+            'occupancy': {'mean': 0.5, 'stdev': 0.01}, \
+            'revenue': {'mean': 1200.0, 'stdev': 30.0}, \
+            'rejection_rate': {'mean': 0.2, 'stdev': 0.02}}])
+        strategy      trials    occupancy %             revenue     rejected %
+        best_fit           8     50.0 ± 1.0       1200.0 ± 30.0     20.0 ± 2.0
+    """
+    print(f"{'strategy':<12}{'trials':>8}{'occupancy %':>15}{'revenue':>20}"
+          f"{'rejected %':>15}")
+    for x in summaries:
+        cells = [f"{x[key]['mean'] * scale:.1f} ± "
+                 f"{x[key]['stdev'] * scale:.1f}"
+                 for key, scale in (('occupancy', 100), ('revenue', 1),
+                                    ('rejection_rate', 100))]
+        print(f"{x['strategy']:<12}{x['trials']:>8}{cells[0]:>15}"
+              f"{cells[1]:>20}{cells[2]:>15}")
+
+
+def main(argv=None):
+    """ Entry point: compare strategies on one line, or run Monte Carlo
+        trials of them with --trials, see --help
+        --doctest runs the doctests instead.
+
+        :param argv: list of strings, or None for sys.argv[1:]
+        :return: nothing
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare seat allocation strategies on random requests")
+    parser.add_argument('--doctest', action='store_true',
+                        help="run the doctests of this module and exit")
+    parser.add_argument('--line', choices=TRAIN_LINES, default='south')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--strategy', choices=ALLOCATION_STRATEGIES,
+                        action='append',
+                        help="strategy to run (default: all)")
+    parser.add_argument('--empty', action='store_true',
+                        help="start without the reserved tickets")
+    parser.add_argument('--trials', type=int,
+                        help="run this many Monte Carlo trials of each "
+                             "strategy in worker processes")
+    parser.add_argument('--workers', type=int,
+                        help="worker processes (default: all processors)")
+    parser.add_argument('--demand', metavar='FILE',
+                        help="station demand weights (see read_demand)")
+    args = parser.parse_args(argv)
+    if args.doctest:
+        import doctest
+
+        doctest.testmod(sys.modules[__name__])
+        return
+    station_filename, seat_filename, ticket_filename = TRAIN_LINES[args.line]
+    if args.demand:
+        _, station_indexes = read_stations(station_filename)
+        try:
+            demand_journeys(*read_demand(args.demand, station_indexes), [1],
+                            0)
+        except ValueError as e:
+            parser.error(f"{args.demand}: {e}")
+    if args.trials:
+        show_monte_carlo([monte_carlo(
+            station_filename, seat_filename,
+            None if args.empty else ticket_filename, args.trials,
+            args.requests, strategy, args.demand, args.workers, args.seed)
+            for strategy in args.strategy or list(ALLOCATION_STRATEGIES)])
+        return
+    show_results(compare_strategies(
+        station_filename, seat_filename,
+        None if args.empty else ticket_filename, args.requests, args.seed,
+        args.strategy))
+
+
+if __name__ == '__main__':
+    main()
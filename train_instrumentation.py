@@ -0,0 +1,202 @@
+import json
+import sys
+import time
+
+import manage_train
+
+
+class LatencyHistogram:
+    """ Histogram of latencies in nanoseconds with at most 1/16 (about 6%)
+        error at any size
+        Values below 32 ns have their own buckets.  Above that, each power of
+            two is split into 16 buckets (like HDR histograms), so a value
+            is found by its top 5 bits and no value is ever too large.  A
+            bucket is reported by its lowest value, which is below the
+            recorded values by less than the bucket width: 1/16 of the
+            value just above a power of two, 1/31 just below the next one.
+        >>> histogram = LatencyHistogram()
+        >>> for x in [10, 100, 1000, 1000, 100000]:
+        ...     histogram.record(x)
+        >>> histogram.count, histogram.min, histogram.max
+        (5, 10, 100000)
+        >>> histogram.percentile(50), histogram.percentile(100)
+        (992, 98304)
+        >>> histogram = LatencyHistogram()
+        >>> histogram.record(1000)
+        >>> histogram.percentile(50)
+        1000
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def bucket(value):
+        shift = max(value.bit_length() - 5, 0)
+        return (shift << 4) + (value >> shift)
+
+    @staticmethod
+    def bucket_value(bucket):
+        """ Return the lowest value of bucket
+        """
+        shift = max((bucket >> 4) - 1, 0)
+        return (bucket - (shift << 4)) << shift
+
+    def record(self, value):
+        bucket = self.bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """ Return the value below which percent of the values lie (lowest
+            value of its bucket, but never below min or above max), or None
+            if nothing was recorded
+        """
+        if not self.count:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(max(self.bucket_value(bucket), self.min), self.max)
+        return self.max
+
+
+# functions timed by Instrumentation by default
+INSTRUMENTED_FUNCTIONS = ('check_routes_available', 'find_available_seats',
+                          'get_ticket_price', 'update_seat', 'remove_ticket',
+                          'process_request')
+
+
+class Instrumentation:
+    """ Call counters and latency histograms of module functions, switched on
+        and off while the program runs
+        enable() replaces each named module function with a wrapper that
+            counts calls and times every sample_every-th call into a
+            LatencyHistogram; disable() puts the original functions back, so
+            when it is off there is no cost at all.  Only calls through the
+            globals of module see the wrappers (not functions imported
+            elsewhere with from manage_train import ...).
+        Counts are not locked, so they may miss a few calls made from several
+            threads at once.
+        :param module: module whose functions are instrumented
+        >>> instrumentation = Instrumentation()
+        >>> instrumentation.enable(['get_ticket_price'])
+        >>> manage_train.get_ticket_prices({'AA': 0, 'BB': 1}, \
+            {'AA': [0], 'BB': [9]}, 0, 1)
+        [9]
+        >>> instrumentation.disable()
+        >>> manage_train.get_ticket_prices({'AA': 0, 'BB': 1}, \
+            {'AA': [0], 'BB': [9]}, 0, 1)
+        [9]
+        >>> report = instrumentation.report()
+        >>> report['get_ticket_price']['calls'], \
+            report['get_ticket_price']['timed']
+        (1, 1)
+    """
+
+    def __init__(self, module=manage_train):
+        self.module = module
+        self.enabled = {}
+        self.calls = {}
+        self.histograms = {}
+
+    def enable(self, names=INSTRUMENTED_FUNCTIONS, sample_every=1):
+        """ Count calls of functions names, and time one call in
+            sample_every
+        """
+        self.disable()
+        module = vars(self.module)
+        for name in names:
+            function = module[name]
+            self.calls.setdefault(name, 0)
+            self.histograms.setdefault(name, LatencyHistogram())
+            self.enabled[name] = function
+            module[name] = self._wrap(name, function, sample_every)
+
+    def _wrap(self, name, function, sample_every):
+        calls = self.calls
+        histogram = self.histograms[name]
+        clock = time.perf_counter_ns
+
+        def wrapper(*args, **kwargs):
+            n = calls[name] = calls[name] + 1
+            if n % sample_every:
+                return function(*args, **kwargs)
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.record(clock() - start)
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__wrapped__ = function
+        return wrapper
+
+    def disable(self):
+        """ Put the original functions back (counts and histograms are kept)
+        """
+        module = vars(self.module)
+        for name, function in self.enabled.items():
+            module[name] = function
+        self.enabled = {}
+
+    def reset(self):
+        for name in self.calls:
+            self.calls[name] = 0
+            self.histograms[name].__init__()
+
+    def report(self):
+        """ Return a dictionary where key is function name, and value is a
+            dictionary of 'calls', 'timed' (calls in the histogram) and
+            'min_us', 'mean_us', 'p50_us', 'p90_us', 'p99_us', 'p999_us'
+            and 'max_us' of timed calls (None if no call was timed)
+        """
+        report = {}
+        for name, histogram in self.histograms.items():
+            x = {'calls': self.calls[name], 'timed': histogram.count}
+            timed = histogram.count > 0
+            x['min_us'] = histogram.min / 1000 if timed else None
+            x['mean_us'] = histogram.total / histogram.count / 1000 \
+                if timed else None
+            for label, percent in (('p50', 50), ('p90', 90), ('p99', 99),
+                                   ('p999', 99.9)):
+                x[f"{label}_us"] = histogram.percentile(percent) / 1000 \
+                    if timed else None
+            x['max_us'] = histogram.max / 1000 if timed else None
+            report[name] = x
+        return report
+
+    def dump(self, filename):
+        """ Write report() to filename as JSON
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write("\n")
+
+    def log(self, file=None):
+        """ Display report() as a table (times in microseconds)
+        """
+        lines = [f"{'function':<24}{'calls':>10}{'timed':>10}{'mean':>10}"
+                 f"{'p50':>10}{'p99':>10}{'max':>10}"]
+        for name, x in self.report().items():
+            lines.append(f"{name:<24}{x['calls']:>10}{x['timed']:>10}" +
+                         "".join(f"{x[k]:>10.1f}" if x[k] is not None
+                                 else f"{'-':>10}"
+                                 for k in ('mean_us', 'p50_us', 'p99_us',
+                                           'max_us')))
+        (sys.stderr if file is None else file).write("\n".join(lines) + "\n")
+
+
+INSTRUMENTATION = Instrumentation()
@@ -0,0 +1,125 @@
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+
+from manage_train import SeatTickets, get_ticket_index
+
+
+def get_data_size(value, seen=None):
+    """ Return the number of bytes used by value and everything it holds
+        (dictionaries, lists, tuples, sets, arrays, object attributes),
+        counting objects found in seen, or already counted, only once
+        For SeatTickets only the seat's own arrays are counted, not the
+            station indexes, watchers and TicketIndex it points to.
+
+        :param value: any object
+        :param seen: set of object ids or None
+        :return: int
+        >>> get_data_size([]) == sys.getsizeof([])
+        True
+        >>> x = [1000, 2000]
+        >>> get_data_size([x, x]) == get_data_size([x]) + 8
+        True
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, SeatTickets):
+        return size + sum(get_data_size(x, seen) for x in (
+            value.origins, value.dests, value.ids))
+    if isinstance(value, dict):
+        size += sum(get_data_size(k, seen) + get_data_size(v, seen)
+                    for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(get_data_size(x, seen) for x in value)
+    if hasattr(value, '__dict__'):
+        size += get_data_size(vars(value), seen)
+    return size
+
+
+class Profiler:
+    """ Profile one run: sample the call stack of the thread that starts it
+        every interval seconds, and trace memory with tracemalloc
+        write(prefix, lines) writes <prefix>.collapsed, one line per stack
+            ('outer;inner;innermost count', as read by flamegraph tools),
+            and <prefix>.memory.txt, the memory used by station_fees,
+            station_indexes, the ticket lists and the TicketIndex of each
+            line or run (see get_data_size), and the lines of code that
+            allocated most.
+
+        :param interval: float
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.thread_id = None
+        self.snapshot = None
+        self.peak = 0
+
+    def start(self):
+        tracemalloc.start()
+        self.thread_id = threading.get_ident()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ("
+                             f"{os.path.basename(code.co_filename)}:"
+                             f"{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.snapshot = tracemalloc.take_snapshot()
+        self.peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    def write(self, prefix, lines=None, top=15):
+        """ Write <prefix>.collapsed and <prefix>.memory.txt
+            lines is a list of TrainLine (e.g. TrainService.loaded_lines(),
+            so that loaded runs are included).
+        """
+        with open(prefix + '.collapsed', 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        out = []
+        for line in lines or []:
+            seen = set()
+            out.append(f"line {line.name}")
+            out.append(f"  {'station_fees':<20}"
+                       f"{get_data_size(line.station_fees, seen):>14,}")
+            out.append(f"  {'station_indexes':<20}"
+                       f"{get_data_size(line.station_indexes, seen):>14,}")
+            tickets = sum(len(x) for x in line.train_seats.values())
+            out.append(f"  {'ticket lists':<20}"
+                       f"{get_data_size(line.train_seats, seen):>14,}"
+                       f"  ({len(line.train_seats)} seats, {tickets} tickets)")
+            ticket_index = get_ticket_index(line.train_seats)
+            if ticket_index is not None:
+                out.append(f"  {'ticket index':<20}"
+                           f"{get_data_size(ticket_index, seen):>14,}")
+        statistics = self.snapshot.statistics('lineno')
+        out.append(f"traced memory: {sum(x.size for x in statistics):,} "
+                   f"bytes, peak {self.peak:,} bytes")
+        out.append(f"top {top} allocating lines:")
+        for x in statistics[:top]:
+            frame = x.traceback[0]
+            out.append(f"  {os.path.basename(frame.filename)}:{frame.lineno}"
+                       f"  {x.size:,} bytes in {x.count:,} blocks")
+        with open(prefix + '.memory.txt', 'w') as f:
+            f.write("\n".join(out) + "\n")
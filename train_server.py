@@ -0,0 +1,294 @@
+import asyncio
+import json
+import traceback
+
+import manage_train
+from manage_train import (SeatTickets, StationFees, StationIndexes, TrainLine,
+                          TrainService, check_service_date, get_ticket_prices,
+                          read_request_station)
+from train_instrumentation import INSTRUMENTATION
+
+
+def handle_request(service, request, line_name='south',
+                   strategy='first_fit'):
+    """ Apply one server request to a line of service
+        request is a dictionary with key 'action', optional 'line' (default
+            line_name), optional 'date' (ISO date, at most
+            BOOKING_HORIZON_DAYS ahead) and 'train' (int from 1) to use one
+            run of the line (see TrainService.run), optional 'id' (copied to
+            the result), and
+            'show-seats': nothing else.
+            'quote': 'origin' and 'dest'.
+            'reserve', 'cancel': as in process_request.
+            'hold': as 'reserve', and optional 'ttl' (seconds, default 600).
+            'confirm', 'release': 'hold', the hold id given by 'hold'.
+            'clear': nothing else.
+            'instrument': 'enable' (true or false) and optional
+                'sample_every' (see train_instrumentation.Instrumentation
+                .enable); no line.
+            'stats': nothing else (no line).
+        Return a result dictionary with 'status' 'seats' (with 'seats', a
+            dictionary of seat: list of [origin, dest]), 'quoted' (with
+            'prices' and 'available', the ticket price and the number of
+            available seats of each class), 'held' (with 'hold', 'seat' and
+            'price'), 'confirmed', 'released', 'cleared', 'instrumented',
+            'stats' (with 'functions', see Instrumentation.report, and
+            'cache', AvailabilityCache.stats of each loaded line), or as
+            process_request.
+
+        :param service: TrainService
+        :param request: dictionary
+        :param line_name: string
+        :param strategy: string
+        :return: dictionary
+        >>> indexes = StationIndexes({'AA': 0, 'BB': 1, 'CC': 2})
+        >>> seats = {'1A': SeatTickets(indexes, seat='1A'), \
+            '2A': SeatTickets(indexes, seat='2A')}
+        >>> service = TrainService({})
+        >>> service.lines['t'] = TrainLine('t', StationFees({'AA': [0, 0], \
+            'BB': [200, 100], 'CC': [275, 150]}), indexes, seats, [1, 2])
+        >>> handle_request(service, {'action': 'reserve', 'origin': 'AA', \
+            'dest': 'BB'}, 't')
+        {'status': 'reserved', 'seat': '1A', 'price': 200, 'ticket': 1}
+        >>> handle_request(service, {'id': 7, 'action': 'quote', 'origin': 0,\
+            'dest': 2}, 't')
+        {'id': 7, 'status': 'quoted', 'prices': [275, 150], 'available': [0, 1]}
+        >>> handle_request(service, {'action': 'show-seats', 'line': 't'})
+        {'status': 'seats', 'seats': {'1A': [['AA', 'BB']], '2A': []}}
+        >>> handle_request(service, {'action': 'hold', 'origin': 'BB', \
+            'dest': 'CC', 'class': 2}, 't')
+        {'status': 'held', 'hold': 1, 'seat': '2A', 'price': 50}
+        >>> handle_request(service, {'action': 'hold', 'origin': 'BB', \
+            'dest': 'CC', 'class': '2'}, 't')
+        {'status': 'rejected', 'reason': 'invalid class'}
+        >>> handle_request(service, {'action': 'hold', 'origin': 'BB', \
+            'dest': 'CC', 'ttl': 'x'}, 't')
+        {'status': 'rejected', 'reason': 'invalid ttl'}
+        >>> handle_request(service, {'action': 'release', 'hold': [1]}, 't')
+        {'status': 'rejected', 'reason': 'hold does not exist'}
+        >>> handle_request(service, {'action': 'confirm', 'hold': 1}, 't')
+        {'status': 'confirmed'}
+        >>> handle_request(service, {'action': 'release', 'hold': 1}, 't')
+        {'status': 'rejected', 'reason': 'hold does not exist'}
+        >>> handle_request(service, {'action': 'clear', 'line': 'x'})
+        {'status': 'rejected', 'reason': 'invalid line'}
+        >>> handle_request(service, {'action': 'clear', 'line': ['t']})
+        {'status': 'rejected', 'reason': 'invalid line'}
+        >>> handle_request(service, {'action': 'clear'}, 't')
+        {'status': 'cleared'}
+        >>> handle_request(service, {'action': 'instrument', 'enable': True, \
+            'sample_every': 'x'})
+        {'status': 'rejected', 'reason': 'invalid sample_every'}
+        >>> import datetime
+        >>> today = datetime.date.today().isoformat()
+        >>> [handle_request(service, {'action': 'show-seats', 'line': 't', \
+            'date': today, 'train': x})['reason'] for x in (True, 0, '1')]
+        ['invalid run', 'invalid run', 'invalid run']
+        >>> handle_request(service, {'action': 'stats'})['cache']
+        {'t': {'hits': 0, 'misses': 1, 'journeys': 1}}
+    """
+    result = {'id': request['id']} if 'id' in request else {}
+    action = request.get('action')
+    if action == 'instrument':
+        sample_every = request.get('sample_every', 1)
+        if not isinstance(sample_every, int) or \
+                isinstance(sample_every, bool) or sample_every < 1:
+            result.update(status='rejected', reason='invalid sample_every')
+            return result
+        if request.get('enable'):
+            INSTRUMENTATION.enable(sample_every=sample_every)
+        else:
+            INSTRUMENTATION.disable()
+        result.update(status='instrumented')
+        return result
+    if action == 'stats':
+        result.update(status='stats', functions=INSTRUMENTATION.report(),
+                      cache={line.name: line.cache.stats()
+                             for line in service.loaded_lines()})
+        return result
+    name = request.get('line', line_name)
+    if not isinstance(name, str) or (name not in service.lines and
+                                     name not in service.line_files):
+        result.update(status='rejected', reason='invalid line')
+        return result
+    if 'date' in request:
+        train = request.get('train')
+        if check_service_date(request['date']) is None or \
+                not isinstance(train, int) or isinstance(train, bool) or \
+                train < 1:
+            result.update(status='rejected', reason='invalid run')
+            return result
+        line = service.run(name, request['date'], train)
+    else:
+        line = service.line(name)
+    if action == 'show-seats':
+        result.update(status='seats', seats={
+            i: [[x['origin'], x['dest']] for x in line.train_seats[i]]
+            for i in line.train_seats})
+    elif action == 'quote':
+        origin_index = read_request_station(line.station_indexes,
+                                            request.get('origin'))
+        dest_index = read_request_station(line.station_indexes,
+                                          request.get('dest'))
+        if origin_index is None or dest_index is None or \
+                dest_index <= origin_index:
+            result.update(status='rejected', reason='invalid station')
+            return result
+        prices = get_ticket_prices(line.station_indexes, line.station_fees,
+                                   origin_index, dest_index)
+        counts = line.cache.counts(origin_index, dest_index)
+        result.update(status='quoted', prices=list(prices), available=[
+            counts.get(c, 0) for c in range(1, len(prices) + 1)])
+    elif action == 'hold':
+        origin_index = read_request_station(line.station_indexes,
+                                            request.get('origin'))
+        dest_index = read_request_station(line.station_indexes,
+                                          request.get('dest'))
+        if origin_index is None or dest_index is None or \
+                dest_index <= origin_index:
+            result.update(status='rejected', reason='invalid station')
+            return result
+        try:
+            held = line.holds.hold(origin_index, dest_index,
+                                   request.get('seat'), request.get('class'),
+                                   request.get('ttl', 600))
+        except ValueError as e:
+            result.update(status='rejected', reason=str(e))
+            return result
+        if held is None:
+            result.update(status='rejected', reason='no available seat')
+        else:
+            result.update(status='held', hold=held[0], seat=held[1],
+                          price=held[2])
+    elif action in ('confirm', 'release'):
+        hold_id = request.get('hold')
+        if isinstance(hold_id, int) and not isinstance(hold_id, bool) and \
+                getattr(line.holds, action)(hold_id):
+            result.update(status={'confirm': 'confirmed',
+                                  'release': 'released'}[action])
+        else:
+            result.update(status='rejected', reason='hold does not exist')
+    elif action == 'clear':
+        line.engine.clear()
+        line.holds.clear()
+        result.update(status='cleared')
+    else:
+        # called through the module, so that Instrumentation sees the call
+        result.update(manage_train.process_request(
+            request, line.train_seats, line.station_indexes,
+            line.station_fees, line.finder, line.journal, strategy))
+    return result
+
+
+async def serve_client(service, reader, writer, line_name='south',
+                       strategy='first_fit'):
+    """ Answer JSON lines requests of one client connection until it closes
+        Each request line gets one result line (see handle_request), in
+            order.  A line that is not a JSON object, or a request that
+            handle_request fails on, is rejected with reason 'invalid
+            request', and the connection goes on with the next line.  The
+            traceback of a failed request is printed to standard error.
+
+        :param service: TrainService
+        :param reader: asyncio.StreamReader
+        :param writer: asyncio.StreamWriter
+        :param line_name: string
+        :param strategy: string
+        :return: nothing
+    """
+    try:
+        while True:
+            try:
+                text = await reader.readline()
+            except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                break
+            if not text:
+                break
+            if not text.strip():
+                continue
+            try:
+                request = json.loads(text)
+            except ValueError:
+                request = None
+            result = None
+            if isinstance(request, dict):
+                try:
+                    result = handle_request(service, request, line_name,
+                                            strategy)
+                except Exception:
+                    traceback.print_exc()
+            if result is None:
+                result = {'id': request['id']} \
+                    if isinstance(request, dict) and 'id' in request else {}
+                result.update(status='rejected', reason='invalid request')
+            writer.write(json.dumps(result).encode() + b"\n")
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def expire_holds(service, interval=1.0, idle_seconds=600):
+    """ Expire the holds of all loaded lines and runs, and evict runs not
+        used for idle_seconds, every interval seconds, until cancelled
+
+        :param service: TrainService
+        :param interval: float
+        :param idle_seconds: float
+        :return: nothing
+    """
+    while True:
+        await asyncio.sleep(interval)
+        for line in service.loaded_lines():
+            line.holds.expire()
+        for inventory in service.inventories.values():
+            inventory.evict_idle(idle_seconds)
+
+
+async def serve(service, address, line_name='south', strategy='first_fit'):
+    """ Serve JSON lines requests (see serve_client) on address until
+        cancelled
+        address is 'host:port' for TCP, or else the path of a Unix socket.
+        All connections share the lines of service.  Requests are handled
+            one at a time on the event loop, so they never run at the same
+            time.  Expired holds are canceled every second, and runs idle
+            for 10 minutes are evicted.
+
+        :param service: TrainService
+        :param address: string
+        :param line_name: string
+        :param strategy: string
+        :return: nothing
+    """
+    def client(reader, writer):
+        return serve_client(service, reader, writer, line_name, strategy)
+
+    host, _, port = address.rpartition(':')
+    if port.isdigit():
+        server = await asyncio.start_server(client, host or None, int(port),
+                                            backlog=4096)
+    else:
+        server = await asyncio.start_unix_server(client, address,
+                                                 backlog=4096)
+    expiry = asyncio.create_task(expire_holds(service))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        expiry.cancel()
+
+
+def run_server(service, address, line_name='south', strategy='first_fit'):
+    """ Run serve on a new event loop until interrupted (Ctrl-C)
+
+        :param service: TrainService
+        :param address: string
+        :param line_name: string
+        :param strategy: string
+        :return: nothing
+    """
+    try:
+        asyncio.run(serve(service, address, line_name, strategy))
+    except KeyboardInterrupt:
+        pass